@@ -1,3 +1,4 @@
+import os
 from sub_units.bayes_model_implementations.moving_window_model import \
     MovingWindowModel  # want to make an instance of this class for each state / set of params
 from sub_units.utils import run_everything as run_everything_imported  # for plotting the report across all states
@@ -15,6 +16,8 @@ opt_force_calc = False
 opt_force_plot = False
 opt_simplified = False  # set to True to just do statsmodels as a simplified daily service
 override_run_states = None
+opt_county_level = False  # set to True to also fit every county in county_counts_filename (NYT us-counties.csv)
+county_counts_filename = 'us-counties.csv'
 
 
 # ['total', 'Virginia', 'Arkansas', 'Connecticut', 'Alaska', 'South Dakota', 'Hawaii', 'Vermont', 'Wyoming'] # None
@@ -131,9 +134,26 @@ def run_everything():
     # uniform priors with bounds:
     priors = curve_fit_bounds
 
+    if opt_county_level:
+        data_source = load_data.DataStore(counts_filename=county_counts_filename)
+        report_every_n_units = 100
+
+        # run_states comes from the populations, so counties without one would silently drop out of the run
+        county_population_filename = os.path.join(data_source.data_dir, data_source.county_population_filename)
+        if not os.path.exists(county_population_filename):
+            raise FileNotFoundError(f'opt_county_level needs county populations in {county_population_filename} '
+                                    f'(fips and population columns, e.g. from https://www.census.gov/data/datasets/time-series/demo/popest/2010s-counties-total.html)')
+        counties_without_population = data_source.get_units_without_population(level='county')
+        if len(counties_without_population) > 0:
+            print(f'Skipping {len(counties_without_population)} counties missing from {county_population_filename}: '
+                  f'{", ".join(counties_without_population[:10])}{"..." if len(counties_without_population) > 10 else ""}')
+    else:
+        data_source = load_data
+        report_every_n_units = None
+
     # cycle over most populous states first
-    population_ranked_state_names = sorted(load_data.map_state_to_population.keys(),
-                                           key=lambda x: -load_data.map_state_to_population[x])
+    population_ranked_state_names = sorted(data_source.map_state_to_population.keys(),
+                                           key=lambda x: -data_source.map_state_to_population[x])
     run_states = population_ranked_state_names
 
     if override_run_states is not None:
@@ -142,13 +162,13 @@ def run_everything():
     plot_subfolder = run_everything_imported(run_states,
                                              MovingWindowModel,
                                              max_date_str,
-                                             load_data,
+                                             data_source,
                                              state_models_filename=state_models_filename,
                                              state_report_filename=state_report_filename,
                                              moving_window_size=moving_window_size,
                                              n_bootstraps=n_bootstraps,
                                              n_likelihood_samples=n_likelihood_samples,
-                                             load_data_obj=load_data,
+                                             load_data_obj=data_source,
                                              sorted_param_names=sorted_param_names,
                                              sorted_init_condit_names=sorted_init_condit_names,
                                              curve_fit_bounds=curve_fit_bounds,
@@ -161,7 +181,8 @@ def run_everything():
                                              extra_params=extra_params,
                                              plot_param_names=plot_param_names,
                                              opt_statsmodels=True,
-                                             opt_simplified=opt_simplified
+                                             opt_simplified=opt_simplified,
+                                             report_every_n_units=report_every_n_units
                                              )
     
     return plot_subfolder
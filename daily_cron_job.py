@@ -1,14 +1,7 @@
 import os
-import requests
-import covid_moving_window as covid
-from sub_units.bayes_model import ApproxType
-import glob
-import logging
-import boto3
-from botocore.exceptions import ClientError
-from tqdm import tqdm
+import sys
 import datetime
-import generate_plot_browser_moving_window_statsmodels_only as generate_figure_browser
+from sub_units.fetch_data import fetch_if_changed, is_processed, mark_processed
 
 '''
 * Download the latest data to a local directory using curl https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-states.csv
@@ -19,14 +12,34 @@ import generate_plot_browser_moving_window_statsmodels_only as generate_figure_b
 * Push updated plot_browser_moving_window_statsmodels_only directory to GitHub
 '''
 
+opt_force_run = False  # set to True to re-run everything even if upstream data hasn't changed
+
 #####
 # Step 1: Update counts data
 #####
 
-# url = "https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-states.csv"
-# r = requests.get(url, allow_redirects=True)
-# with open('source_data/counts.csv', 'w') as f:
-#     f.write(r.content.decode("utf-8") )
+# conditional GET: only downloads (and only replaces source_data/counts.csv) when upstream has changed
+url = "https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-states.csv"
+counts_filename = 'source_data/counts.csv'
+fetch_if_changed(url, counts_filename)
+# skip only if this exact data already made it through a whole run, so a crashed run gets retried tomorrow
+if is_processed(counts_filename) and not opt_force_run:
+    print('Counts data already processed, nothing to update!')
+    sys.exit(0)
+
+# NB: imported after the early exit above, so a day without new data doesn't pay for these
+import covid_moving_window as covid
+from sub_units.bayes_model import ApproxType
+import glob
+import logging
+import boto3
+from botocore.exceptions import ClientError
+from tqdm import tqdm
+import generate_plot_browser_moving_window_statsmodels_only as generate_figure_browser
+
+# fold the new rows into the cached count cube up front (only the appended days get parsed and re-differenced)
+from sub_units.load_data import data_store
+print(f'Count cube covers {len(data_store.date_range)} days')
 
 #####
 # Step 2: Run Update
@@ -106,4 +119,6 @@ generate_figure_browser.generate_plot_browser()
 
 # Do this by hand
 # TODO: Figure out how to do this automatically instead of by hand
-print('Now add, commit, and push to Github!')
\ No newline at end of file
+print('Now add, commit, and push to Github!')
+
+mark_processed(counts_filename)
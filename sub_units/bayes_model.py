@@ -1,4 +1,6 @@
 from sub_units.utils import Stopwatch, ApproxType
+from sub_units.load_data import SmoothingType, get_smoothing_str, CUBE_CASES, CUBE_DEATHS
+from sub_units import compiled_kernels
 import numpy as np
 import pandas as pd
 from enum import Enum
@@ -8,6 +10,7 @@ import matplotlib
 import matplotlib.pyplot as plt
 import scipy as sp
 import joblib
+import pickle
 from os import path
 from tqdm import tqdm
 import os
@@ -32,6 +35,58 @@ class WhichDistro(Enum):
         return str(self.value)
 
 
+class ParamLayout(object):
+    '''
+    Fixed layout of a full parameter vector: the fitted parameters in sorted_names order, then the static ones
+      run_simulation and the likelihood precursors read parameters out of a flat numpy array by precomputed slot,
+      instead of building a dictionary (and updating it with static_params) on every evaluation.
+    '''
+
+    __slots__ = ('names', 'n_fit', 'map_name_to_slot', 'static_values')
+
+    def __init__(self, sorted_names, static_params):
+        static_names = [name for name in static_params if name not in sorted_names]
+        self.names = list(sorted_names) + static_names
+        self.n_fit = len(sorted_names)
+        self.map_name_to_slot = {name: ind for ind, name in enumerate(self.names)}
+        self.static_values = np.array([static_params[name] for name in static_names], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.names)
+
+    def get_slot(self, name):
+        return self.map_name_to_slot[name]
+
+    def get_slots(self, names):
+        return np.array([self.map_name_to_slot[name] for name in names], dtype=int)
+
+    def get_full_vector(self, in_params):
+        '''
+        Full parameter vector from a dictionary, a list in sorted_names order, or an already full vector
+        :param in_params: params as dict, list or numpy array
+        :return: numpy array of len(self) floats
+        '''
+        if type(in_params) == dict:
+            in_params = [in_params[name] for name in self.names[:self.n_fit]]
+        in_params = np.asarray(in_params, dtype=np.float64)
+        if in_params.size == len(self.names):
+            return in_params
+        full_vector = np.empty(len(self.names))
+        full_vector[:self.n_fit] = in_params
+        full_vector[self.n_fit:] = self.static_values
+        return full_vector
+
+    def get_full_matrix(self, param_matrix):
+        '''
+        Full parameter vectors for every row of an (N, n_fit) parameter matrix
+        :return: (N, len(self)) numpy array
+        '''
+        full_matrix = np.empty((len(param_matrix), len(self.names)))
+        full_matrix[:, :self.n_fit] = param_matrix
+        full_matrix[:, self.n_fit:] = self.static_values
+        return full_matrix
+
+
 class BayesModel(ABC):
 
     # this fella isn't necessary like other abstractmethods, but optional in a subclass that supports statsmodels solutions
@@ -43,13 +98,21 @@ class BayesModel(ABC):
         pass
 
     @abstractmethod
-    def run_simulation(self, in_params):
+    def run_simulation(self, in_params, sol_indices=None):
         pass
 
     # this fella isn't necessary like other abstractmethods, but optional in a subclass that supports statsmodels solutions
     def run_fits_simplified(self, in_params):
         pass
 
+    # this fella isn't necessary like other abstractmethods, but a subclass can set it to a method returning the exact
+    #   Jacobian of self._errfunc_for_least_squares (same signature), otherwise least_squares uses finite differences
+    _jac_for_least_squares = None
+
+    # bootstrap replicates i and j are always fit together when i // bootstrap_block_size == j // bootstrap_block_size,
+    #   for subclasses that fit more than one replicate at a time (see ConvolutionModel._fit_bootstrap_block)
+    bootstrap_block_size = 1
+
     @abstractmethod
     def _get_log_likelihood_precursor(self,
                                       in_params,
@@ -116,9 +179,17 @@ class BayesModel(ABC):
                  log_offset=0.01,
                  # this kwarg became redundant after I filled in zeros with 0.1 in load_data, leave at 0
                  opt_smoothing=True,
+                 smoothing_type=None,  # overrides opt_smoothing, see load_data.SmoothingType
                  prediction_window=28,  # predict four weeks into the future
                  model_approx_types=[ApproxType.BS, ApproxType.LS, ApproxType.MCMC],
                  plot_two_vals=None,
+                 opt_numba=False,  # use the JIT-compiled kernels in compiled_kernels, if numba is installed
+                 n_bootstrap_jobs=1,  # worker processes for render_bootstraps, -1 for one per CPU
+                 bootstrap_seed=0,  # each bootstrap replicate resamples with its own seed derived from this one
+                 bootstrap_checkpoint_every=50,  # how many bootstrap replicates to fit between saves
+                 opt_adaptive_bootstraps=False,  # keep adding n_bootstraps at a time until the intervals settle
+                 max_n_bootstraps=1000,  # cap for opt_adaptive_bootstraps
+                 bootstrap_quantile_tol=0.05,  # how much the intervals may still move, see _opt_bootstrap_quantiles_stable
                  **kwargs
                  ):
 
@@ -127,29 +198,39 @@ class BayesModel(ABC):
             setattr(self, key, val)
 
         self.plot_two_vals = plot_two_vals
+        if opt_numba and not compiled_kernels.opt_numba_available:
+            print('numba not available, falling back to numpy kernels...')
+            opt_numba = False
+        self.opt_numba = opt_numba
         self.prediction_window = prediction_window
         self.map_approx_type_to_MVN = dict()
         self.model_approx_types = model_approx_types
-        self.opt_smoothing = opt_smoothing  # determines whether to smooth results from load_data_obj.get_state_data
+        self.opt_smoothing = opt_smoothing  # determines whether to smooth results from load_data_obj.get_unit_data
+        if smoothing_type is None:
+            smoothing_type = SmoothingType.CENTERED_3_DAY if opt_smoothing else SmoothingType.NONE
+        self.smoothing_type = smoothing_type
         self.log_offset = log_offset
         self.model_type_name = model_type_name
         self.state_name = state_name
         self.max_date_str = max_date_str
         self.n_bootstraps = n_bootstraps
+        self.n_bootstrap_jobs = n_bootstrap_jobs
+        self.bootstrap_seed = bootstrap_seed
+        self.bootstrap_checkpoint_every = bootstrap_checkpoint_every
+        self.opt_adaptive_bootstraps = opt_adaptive_bootstraps
+        self.max_n_bootstraps = max_n_bootstraps
+        self.bootstrap_quantile_tol = bootstrap_quantile_tol
         self.n_likelihood_samples = n_likelihood_samples
         self.burn_in = burn_in
         self.max_date = datetime.datetime.strptime(max_date_str, '%Y-%m-%d')
         self.static_params = static_params
 
-        if self.opt_smoothing:
-            smoothing_str = 'smoothed_'
-        else:
-            smoothing_str = ''
+        smoothing_str = get_smoothing_str(self.smoothing_type)
 
         self.all_data_fit_filename = path.join('state_all_data_fits',
                                                f"{state_name.lower().replace(' ', '_')}_{smoothing_str}{model_type_name}_max_date_{max_date_str.replace('-', '_')}.joblib")
         self.bootstrap_filename = path.join('state_bootstraps',
-                                            f"{state_name.lower().replace(' ', '_')}_{smoothing_str}{model_type_name}_{n_bootstraps}_bootstraps_max_date_{max_date_str.replace('-', '_')}.joblib")
+                                            f"{state_name.lower().replace(' ', '_')}_{smoothing_str}{model_type_name}_bootstraps_max_date_{max_date_str.replace('-', '_')}.pkl")
         self.likelihood_samples_filename_format_str = path.join('state_likelihood_samples',
                                                                 f"{state_name.lower().replace(' ', '_')}_{smoothing_str}{model_type_name}_{{}}_{n_likelihood_samples}_samples_max_date_{max_date_str.replace('-', '_')}.joblib")
         self.likelihood_samples_from_bootstraps_filename = path.join('state_likelihood_samples',
@@ -184,7 +265,8 @@ class BayesModel(ABC):
         if load_data_obj is None:
             from sub_units import load_data as load_data_obj
 
-        state_data = load_data_obj.get_state_data(state_name, opt_smoothing=self.opt_smoothing)
+        # daily counts, cumulative counts and threshold days are preprocessed for every state at once
+        state_data = load_data_obj.get_unit_data(state_name, smoothing_type=self.smoothing_type, max_date=self.max_date)
 
         # I replaced this with the U.S. total so everyone's on the same playing field, otherwise: state_data['sip_date']
         self.SIP_date = datetime.datetime.strptime('2020-03-20', '%Y-%m-%d')
@@ -205,31 +287,19 @@ class BayesModel(ABC):
         # print('max_date_in_days', self.max_date_in_days)
         # print('t_vals', self.t_vals)
 
-        try:
-            self.threshold_cases = min(20, self.series_data[-1, 1] * 0.1)
-            print(f"Setting cases threshold to {self.threshold_cases} ({self.series_data[-1, 1]} total)")
-            self.day_of_threshold_met_case = \
-                [i for i, x in enumerate(self.series_data[:, 1]) if x >= self.threshold_cases][0]
-        except:
-            self.day_of_threshold_met_case = len(self.series_data) - 1
-        try:
-            self.threshold_deaths = min(20, self.series_data[-1, 2] * 0.1)
-            print(f"Setting death threshold to {self.threshold_deaths} ({self.series_data[-1, 2]} total)")
-            self.day_of_threshold_met_death = \
-                [i for i, x in enumerate(self.series_data[:, 2]) if x >= self.threshold_deaths][0]
-        except:
-            self.day_of_threshold_met_death = len(self.series_data) - 1
+        self.threshold_cases, self.threshold_deaths = state_data['thresholds']
+        print(f"Setting cases threshold to {self.threshold_cases}, death threshold to {self.threshold_deaths}")
+        self.day_of_threshold_met_case, self.day_of_threshold_met_death = \
+            (int(x) for x in state_data['day_of_threshold_met'])
 
-        data_cum_tested = self.series_data[:, 1].copy()
-        self.data_new_tested = [data_cum_tested[0]] + [data_cum_tested[i] - data_cum_tested[i - 1] for i in
-                                                       range(1, len(data_cum_tested))]
-
-        data_cum_dead = self.series_data[:, 2].copy()
-        self.data_new_dead = [data_cum_dead[0]] + [data_cum_dead[i] - data_cum_dead[i - 1] for i in
-                                                   range(1, len(data_cum_dead))]
+        self.data_new_tested = state_data['new_counts'][:self.max_date_in_days, CUBE_CASES]
+        self.data_new_dead = state_data['new_counts'][:self.max_date_in_days, CUBE_DEATHS]
 
         delta_t = 17
-        self.data_new_recovered = [0.0] * delta_t + self.data_new_tested
+        self.data_new_recovered = np.concatenate([np.zeros(delta_t), self.data_new_tested])
+
+        # log(actual + log_offset) by (tested/dead, index set), see _get_log_actual
+        self._log_actual_cache = dict()
 
         self.curve_fit_bounds = curve_fit_bounds
         self.priors = priors
@@ -241,6 +311,8 @@ class BayesModel(ABC):
         self.logarithmic_params = logarithmic_params
 
         self.map_name_to_sorted_ind = {val: ind for ind, val in enumerate(self.sorted_names)}
+        self.param_layout = ParamLayout(self.sorted_names, static_params)
+        self.sigma_slots = self.param_layout.get_slots(['sigma_positive', 'sigma_deceased'])
 
         self.all_samples_as_list = list()
         self.all_log_probs_as_list = list()
@@ -266,6 +338,56 @@ class BayesModel(ABC):
         else:
             self.plot_param_names = plot_param_names
 
+    def _get_gaussian_log_likelihood(self, dists, sigma, weights=None):
+        '''
+        sum of -dist ** 2 / (2 * sigma ** 2) + log(1 / sigma) over dists, without the per-point work
+        :param dists: numpy array of distances
+        :param sigma: standard deviation shared by all the points
+        :param weights: how many times each point counts (bootstrap multiplicities), defaults to once each
+        :return: float
+        '''
+        if self.opt_numba:
+            dists = np.asarray(dists, dtype=float)
+            if weights is None:
+                return compiled_kernels.gaussian_log_likelihood(dists, float(sigma))
+            return compiled_kernels.weighted_gaussian_log_likelihood(dists, np.asarray(weights, dtype=float),
+                                                                     float(sigma))
+        if weights is None:
+            return -np.dot(dists, dists) / (2 * sigma ** 2) - len(dists) * np.log(sigma)
+        return -np.dot(weights, dists ** 2) / (2 * sigma ** 2) - np.sum(weights) * np.log(sigma)
+
+    def _get_bootstrap_counts(self, bootstrap_inds):
+        '''
+        Bootstrap replicates as multiplicity counts over cases_indices and deaths_indices
+          Same distribution as resampling the pooled cases and deaths points with replacement, drawn as a multinomial
+          and evaluated as weighted residuals instead of duplicated index lists. Replicate i always draws from the seed
+          (bootstrap_seed, i), so it comes out the same no matter which process fits it or how many others there are.
+        :param bootstrap_inds: which replicates
+        :return: tuple of (len(bootstrap_inds), n_cases) and (len(bootstrap_inds), n_deaths) int arrays
+        '''
+        n_cases = len(self.cases_indices)
+        n_points = n_cases + len(self.deaths_indices)
+        probabilities = np.full(n_points, 1 / n_points)
+        counts = np.array([np.random.default_rng([self.bootstrap_seed, bootstrap_ind]).multinomial(
+            n_points, probabilities) for bootstrap_ind in bootstrap_inds], dtype=int).reshape(-1, n_points)
+        return counts[:, :n_cases], counts[:, n_cases:]
+
+    def _get_log_actual(self, data, indices, which):
+        '''
+        log(data[indices] + log_offset), memoized per index set when data is the model's own (unjittered) series
+        :param data: data_new_tested or data_new_dead, or None for the model's own
+        :param indices: numpy int array of day indices
+        :param which: 'tested' or 'dead'
+        :return: numpy array
+        '''
+        if data is not None:
+            return np.log(np.asarray(data, dtype=np.float64)[indices] + self.log_offset)
+        key = (which, indices.tobytes())
+        if key not in self._log_actual_cache:
+            data = self.data_new_tested if which == 'tested' else self.data_new_dead
+            self._log_actual_cache[key] = np.log(np.asarray(data, dtype=np.float64)[indices] + self.log_offset)
+        return self._log_actual_cache[key]
+
     @staticmethod
     def norm(x, mu=0, std=0):
         return np.exp(-((x - mu) / std) ** 2) / (np.sqrt(2 * np.pi) * std)
@@ -276,6 +398,8 @@ class BayesModel(ABC):
                                    data_new_dead=None,
                                    cases_bootstrap_indices=None,
                                    deaths_bootstrap_indices=None,
+                                   cases_bootstrap_weights=None,
+                                   deaths_bootstrap_weights=None,
                                    precursor_func=None,
                                    ):
         '''
@@ -286,6 +410,8 @@ class BayesModel(ABC):
         :param deaths_bootstrap_indices:  bootstrap indices when applicable
         :param cases_bootstrap_indices: which indices to include in the likelihood?
         :param deaths_bootstrap_indices: which indices to include in the likelihood?
+        :param cases_bootstrap_weights: multiplicity of each of cases_bootstrap_indices, defaults to once each
+        :param deaths_bootstrap_weights: multiplicity of each of deaths_bootstrap_indices, defaults to once each
         :return: list: distances and other loss function contributions
         '''
 
@@ -300,19 +426,21 @@ class BayesModel(ABC):
             cases_bootstrap_indices=cases_bootstrap_indices,
             deaths_bootstrap_indices=deaths_bootstrap_indices)
 
-        dists = positive_dists + deceased_dists
-        vals = positive_vals + deceased_vals
+        # a point that counts w times contributes w * dist ** 2 to the sum of squares
+        if cases_bootstrap_weights is not None:
+            positive_dists = positive_dists * np.sqrt(cases_bootstrap_weights)
+        if deaths_bootstrap_weights is not None:
+            deceased_dists = deceased_dists * np.sqrt(deaths_bootstrap_weights)
+
+        dists = np.concatenate([positive_dists, deceased_dists])
 
-        sigmas = [1 for _ in
-                  vals]  # least squares optimization doesn't care about the sigmas, it's just looking for the mode
-        coeffs = [1 / x for x in sigmas]
-        new_dists = [
-            np.sqrt(dist ** 2 / (2 * sigma ** 2)) for dist, sigma, coeff in zip(dists, sigmas, coeffs)]
+        # least squares optimization doesn't care about the sigmas (all 1 here), it's just looking for the mode
+        new_dists = np.sqrt(dists ** 2 / 2)
 
         # new_dists = [dists[i] / np.sqrt(2 * np.log(np.sqrt(vals[i]))) for i in range(len(dists))]
         # new_dists = [dists[i] / np.sqrt(2 * in_params[self.map_name_to_sorted_ind['sigma']]) for i in range(len(dists))]
 
-        return new_dists + other_errs
+        return np.concatenate([new_dists, other_errs])
 
     def get_log_likelihood(self,
                            in_params,
@@ -320,6 +448,8 @@ class BayesModel(ABC):
                            data_new_dead=None,
                            cases_bootstrap_indices=None,
                            deaths_bootstrap_indices=None,
+                           cases_bootstrap_weights=None,
+                           deaths_bootstrap_weights=None,
                            opt_return_sol=False,
                            precursor_func=None,
                            ):
@@ -330,10 +460,12 @@ class BayesModel(ABC):
         :param deaths_bootstrap_indices:  bootstrap indices when applicable
         :param cases_bootstrap_indices: which indices to include in the likelihood?
         :param deaths_bootstrap_indices: which indices to include in the likelihood?
+        :param cases_bootstrap_weights: multiplicity of each of cases_bootstrap_indices, defaults to once each
+        :param deaths_bootstrap_weights: multiplicity of each of deaths_bootstrap_indices, defaults to once each
         :return: float: log likelihood
         '''
 
-        params = self.convert_params_as_list_to_dict(in_params)
+        params = self.param_layout.get_full_vector(in_params)
 
         if precursor_func is None:
             precursor_func = self._get_log_likelihood_precursor
@@ -347,18 +479,13 @@ class BayesModel(ABC):
             deaths_bootstrap_indices=deaths_bootstrap_indices)
 
         # sigmas = [1 / np.sqrt(x) for x in vals] # using the rule that log(x) - log(x - y) => 1/y for x >> y, and here y = sqrt(x)
-        sigmas_positive = [params['sigma_positive'] for _ in vals_positive]
-        sigmas_deceased = [params['sigma_deceased'] for _ in vals_deceased]
-
-        coeffs_positive = [1 / x for x in sigmas_positive]
-        coeffs_deceased = [1 / x for x in sigmas_deceased]
-        return_val_positive = sum(
-            -dist ** 2 / (2 * sigma ** 2) + np.log(coeff) for dist, sigma, coeff in
-            zip(dists_positive, sigmas_positive, coeffs_positive))
-        return_val_deceased = sum(
-            -dist ** 2 / (2 * sigma ** 2) + np.log(coeff) for dist, sigma, coeff in
-            zip(dists_deceased, sigmas_deceased, coeffs_deceased))
-        return_val_other = - sum(x ** 2 for x in other_errs)
+        # every point in a series shares its sigma, so the Gaussian log-normalizers sum in closed form
+        sigma_positive, sigma_deceased = params[self.sigma_slots]
+        return_val_positive = self._get_gaussian_log_likelihood(dists_positive, sigma_positive,
+                                                                weights=cases_bootstrap_weights)
+        return_val_deceased = self._get_gaussian_log_likelihood(dists_deceased, sigma_deceased,
+                                                                weights=deaths_bootstrap_weights)
+        return_val_other = - np.dot(other_errs, other_errs)
 
         return_val = return_val_positive + return_val_deceased + return_val_other
 
@@ -367,12 +494,99 @@ class BayesModel(ABC):
         else:
             return return_val
 
+    def _get_param_matrix(self, in_params_list):
+        '''
+        Stack parameter vectors (lists, arrays or dictionaries) into an (N, n_params) array in sorted_names order
+        '''
+        if isinstance(in_params_list, np.ndarray):
+            return np.atleast_2d(in_params_list).astype(np.float64, copy=False).reshape(-1, len(self.sorted_names))
+        return np.array([self.convert_params_as_dict_to_list(x) for x in in_params_list],
+                        dtype=np.float64).reshape(-1, len(self.sorted_names))
+
+    def run_simulation_batch(self, param_matrix, sol_indices=None):
+        '''
+        run_simulation for many parameter vectors at once
+          This fallback just loops, subclasses override it with a vectorized version.
+        :param param_matrix: (N, n_params) array in sorted_names order, or a list of parameter lists or dictionaries
+        :param sol_indices: which points of t_vals to simulate, defaults to all of them
+        :return: (N, 3, T) numpy array of contagious, positive and deceased trajectories
+        '''
+        param_matrix = self._get_param_matrix(param_matrix)
+        return np.array([self.run_simulation(params, sol_indices=sol_indices) for params in param_matrix]).reshape(
+            len(param_matrix), 3, -1)
+
+    def _get_log_likelihood_precursor_batch(self,
+                                            param_matrix,
+                                            data_new_tested=None,
+                                            data_new_dead=None,
+                                            cases_bootstrap_indices=None,
+                                            deaths_bootstrap_indices=None):
+        '''
+        Distances for many parameter vectors at once, same as _get_log_likelihood_precursor row by row
+          This fallback just loops, subclasses override it with a vectorized version.
+        :param param_matrix: (N, n_params) array
+        :return: tuple of (N, n_cases) distances, (N, n_deaths) distances, (N, n_other) other errors
+        '''
+        precursors = [self._get_log_likelihood_precursor(params,
+                                                         data_new_tested=data_new_tested,
+                                                         data_new_dead=data_new_dead,
+                                                         cases_bootstrap_indices=cases_bootstrap_indices,
+                                                         deaths_bootstrap_indices=deaths_bootstrap_indices)
+                      for params in param_matrix]
+        return tuple(np.array([x[i] for x in precursors], dtype=np.float64).reshape(len(param_matrix), -1)
+                     for i in range(3))
+
+    def get_log_likelihood_batch(self,
+                                 param_matrix,
+                                 data_new_tested=None,
+                                 data_new_dead=None,
+                                 cases_bootstrap_indices=None,
+                                 deaths_bootstrap_indices=None,
+                                 cases_bootstrap_weights=None,
+                                 deaths_bootstrap_weights=None,
+                                 batch_size=1000):
+        '''
+        Obtain the log likelihood for many parameter vectors at once
+        :param param_matrix: (N, n_params) array in sorted_names order, or a list of parameter lists or dictionaries
+        :param cases_bootstrap_weights: multiplicity of each of cases_bootstrap_indices, defaults to once each
+        :param deaths_bootstrap_weights: multiplicity of each of deaths_bootstrap_indices, defaults to once each
+        :param batch_size: how many rows to evaluate together (bounds memory)
+        :return: numpy array of N log likelihoods, same as get_log_likelihood row by row
+        '''
+        param_matrix = self._get_param_matrix(param_matrix)
+        log_likelihoods = np.zeros(len(param_matrix))
+        for start in range(0, len(param_matrix), batch_size):
+            batch = param_matrix[start:start + batch_size]
+            dists_positive, dists_deceased, other_errs = self._get_log_likelihood_precursor_batch(
+                batch,
+                data_new_tested=data_new_tested,
+                data_new_dead=data_new_dead,
+                cases_bootstrap_indices=cases_bootstrap_indices,
+                deaths_bootstrap_indices=deaths_bootstrap_indices)
+            sigma_positive, sigma_deceased = self.param_layout.get_full_matrix(batch)[:, self.sigma_slots].T
+            n_positive, n_deceased = dists_positive.shape[1], dists_deceased.shape[1]
+            if cases_bootstrap_weights is not None:
+                dists_positive = dists_positive * np.sqrt(cases_bootstrap_weights)
+                n_positive = np.sum(cases_bootstrap_weights)
+            if deaths_bootstrap_weights is not None:
+                dists_deceased = dists_deceased * np.sqrt(deaths_bootstrap_weights)
+                n_deceased = np.sum(deaths_bootstrap_weights)
+            log_likelihoods[start:start + batch_size] = \
+                - np.einsum('ij,ij->i', dists_positive, dists_positive) / (2 * sigma_positive ** 2) \
+                - n_positive * np.log(sigma_positive) \
+                - np.einsum('ij,ij->i', dists_deceased, dists_deceased) / (2 * sigma_deceased ** 2) \
+                - n_deceased * np.log(sigma_deceased) \
+                - np.einsum('ij,ij->i', other_errs, other_errs)
+        return log_likelihoods
+
     def fit_curve_exactly_via_least_squares(self,
                                             p0,
                                             data_tested=None,
                                             data_dead=None,
                                             tested_indices=None,
-                                            deaths_indices=None):
+                                            deaths_indices=None,
+                                            tested_weights=None,
+                                            deaths_weights=None):
         '''
         Given initial parameters, fit the curve with MSE
         :param p0: initial parameters
@@ -380,15 +594,30 @@ class BayesModel(ABC):
         :param data_dead: list of observables (passable since we may want to add jitter)
         :param tested_indices: bootstrap indices when applicable
         :param deaths_indices: bootstrap indices when applicable
+        :param tested_weights: bootstrap multiplicity of each of tested_indices when applicable
+        :param deaths_weights: bootstrap multiplicity of each of deaths_indices when applicable
         :return: optimized parameters as dictionary
         '''
         optimize_test_errfunc = partial(self._errfunc_for_least_squares,
                                         data_new_tested=data_tested,
                                         data_new_dead=data_dead,
                                         cases_bootstrap_indices=tested_indices,
-                                        deaths_bootstrap_indices=deaths_indices)
+                                        deaths_bootstrap_indices=deaths_indices,
+                                        cases_bootstrap_weights=tested_weights,
+                                        deaths_bootstrap_weights=deaths_weights)
+        if self._jac_for_least_squares is None:
+            optimize_test_jac = '2-point'
+        else:
+            optimize_test_jac = partial(self._jac_for_least_squares,
+                                        data_new_tested=data_tested,
+                                        data_new_dead=data_dead,
+                                        cases_bootstrap_indices=tested_indices,
+                                        deaths_bootstrap_indices=deaths_indices,
+                                        cases_bootstrap_weights=tested_weights,
+                                        deaths_bootstrap_weights=deaths_weights)
         results = sp.optimize.least_squares(optimize_test_errfunc,
                                             p0,
+                                            jac=optimize_test_jac,
                                             bounds=(
                                                 [self.curve_fit_bounds[name][0] for name in self.sorted_names],
                                                 [self.curve_fit_bounds[name][1] for name in self.sorted_names]))
@@ -482,6 +711,8 @@ class BayesModel(ABC):
                                  in_params,
                                  tested_indices=None,
                                  deaths_indices=None,
+                                 tested_weights=None,
+                                 deaths_weights=None,
                                  method=None,
                                  print_success=False,
                                  opt_cov=False
@@ -493,6 +724,8 @@ class BayesModel(ABC):
         :param data_dead: list of observables (passable since we may want to add jitter)
         :param tested_indices: bootstrap indices when applicable
         :param deaths_indices: bootstrap indices when applicable
+        :param tested_weights: bootstrap multiplicity of each of tested_indices when applicable
+        :param deaths_weights: bootstrap multiplicity of each of deaths_indices when applicable
         :return: optimized parameters as dictionary
         '''
 
@@ -504,7 +737,9 @@ class BayesModel(ABC):
         def get_neg_log_likelihood(p):
             return -self.get_log_likelihood(p,
                                             cases_bootstrap_indices=tested_indices,
-                                            deaths_bootstrap_indices=deaths_indices
+                                            deaths_bootstrap_indices=deaths_indices,
+                                            cases_bootstrap_weights=tested_weights,
+                                            deaths_bootstrap_weights=deaths_weights
                                             )
 
         bounds_to_use = [self.curve_fit_bounds[name] for name in self.sorted_names]
@@ -626,7 +861,7 @@ class BayesModel(ABC):
         print(f'Rendering solutions for {key}...')
         param_inds_to_plot = np.random.choice(param_inds_to_plot, min(n_samples, len(param_inds_to_plot)),
                                               replace=False)
-        sols_to_plot = [self.run_simulation(in_params=params[param_ind]) for param_ind in tqdm(param_inds_to_plot)]
+        sols_to_plot = self.run_simulation_batch([params[param_ind] for param_ind in param_inds_to_plot])
 
         self._plot_all_solutions_sub_distinct_lines_with_alpha(sols_to_plot,
                                                                plot_filename_filename=f'{key}_solutions_discrete.png')
@@ -1162,73 +1397,280 @@ class BayesModel(ABC):
         self.hessian_model = sp.stats.multivariate_normal(mean=self.convert_params_as_dict_to_list(all_data_params),
                                                           cov=all_data_cov, allow_singular=True)
 
-    def render_bootstraps(self):
+    def _fit_bootstrap_replicates(self, bootstrap_inds, opt_progress_bar=False):
         '''
-        Compute the bootstrap solutions
-        :return: None
+        Fit a list of bootstrap replicates, starting each one from the all-data parameters
+        :param bootstrap_inds: which replicates (see _get_bootstrap_counts)
+        :param opt_progress_bar: show a tqdm progress bar
+        :return: list of parameter dictionaries, one per replicate
         '''
+        # resample cases and deaths together, as how many times each point shows up in each replicate
+        cases_indices = np.asarray(self.cases_indices, dtype=int)
+        deaths_indices = np.asarray(self.deaths_indices, dtype=int)
+        all_cases_counts, all_deaths_counts = self._get_bootstrap_counts(bootstrap_inds)
 
-        bootstrap_sols = list()
         bootstrap_params = list()
-        success = False
+        for cases_counts, deaths_counts in tqdm(zip(all_cases_counts, all_deaths_counts), total=len(all_cases_counts),
+                                                disable=not opt_progress_bar):
+            # points that weren't drawn drop out, the rest are weighted by how often they were drawn
+            cases_bootstrap_indices = cases_indices[cases_counts > 0]
+            deaths_bootstrap_indices = deaths_indices[deaths_counts > 0]
+
+            # Add normal-distributed jitter with sigma=sqrt(N)
+            # tested_jitter = [
+            #     max(0.01, self.data_new_tested[i] + np.random.normal(0, np.sqrt(self.data_new_tested[i]))) for i in
+            #     range(len(self.data_new_tested))]
+            # dead_jitter = [max(0.01, self.data_new_dead[i] + np.random.normal(0, np.sqrt(self.data_new_dead[i])))
+            #                for i in
+            #                range(len(self.data_new_dead))]
+
+            # here is where we select the all-data parameters as our starting point
+            starting_point_as_list = [self.all_data_params[key] for key in self.sorted_names]
+
+            # params_as_dict, cov = self.fit_curve_via_likelihood(starting_point_as_list,
+            #                                                # data_tested=tested_jitter,
+            #                                                # data_dead=dead_jitter,
+            #                                                tested_indices=cases_bootstrap_indices,
+            #                                                deaths_indices=deaths_bootstrap_indices
+            #                                                )
+
+            params_as_dict = self.fit_curve_exactly_via_least_squares(starting_point_as_list,
+                                                                      # data_tested=tested_jitter,
+                                                                      # data_dead=dead_jitter,
+                                                                      tested_indices=cases_bootstrap_indices,
+                                                                      deaths_indices=deaths_bootstrap_indices,
+                                                                      tested_weights=cases_counts[cases_counts > 0],
+                                                                      deaths_weights=deaths_counts[deaths_counts > 0]
+                                                                      )
+
+            bootstrap_params.append(params_as_dict)
+
+        return bootstrap_params
+
+    def _get_bootstrap_blocks(self, bootstrap_inds):
+        '''
+        Group replicates into the blocks that get fit together, see bootstrap_block_size
+        :param bootstrap_inds: which replicates
+        :return: list of lists of replicate indices, in bootstrap_inds order
+        '''
+        blocks = list()
+        for bootstrap_ind in bootstrap_inds:
+            if blocks and blocks[-1][-1] // self.bootstrap_block_size == bootstrap_ind // self.bootstrap_block_size:
+                blocks[-1].append(bootstrap_ind)
+            else:
+                blocks.append([bootstrap_ind])
+        return blocks
 
-        try:
-            bootstrap_dict = joblib.load(self.bootstrap_filename)
-            bootstrap_sols = bootstrap_dict['bootstrap_sols']
-            bootstrap_params = bootstrap_dict['bootstrap_params']
-            success = True
-            self.loaded_bootstraps = True
-        except:
-            self.loaded_bootstraps = False
+    def _fit_bootstrap_replicates_in_parallel(self, bootstrap_inds):
+        '''
+        _fit_bootstrap_replicates, fanned out over n_bootstrap_jobs worker processes
+          Every replicate has its own seed and starting point, and blocks are never split between workers, so the
+          results (and the order they come back in) don't depend on the number of workers.
+        :param bootstrap_inds: which replicates
+        :return: list of parameter dictionaries in bootstrap_inds order
+        '''
+        bootstrap_inds = list(bootstrap_inds)
+        n_jobs = joblib.effective_n_jobs(self.n_bootstrap_jobs)
+        if n_jobs == 1 or len(bootstrap_inds) <= 1:
+            return self._fit_bootstrap_replicates(bootstrap_inds, opt_progress_bar=True)
+
+        # a few chunks per worker keeps them all busy without pickling the model once per replicate
+        blocks = self._get_bootstrap_blocks(bootstrap_inds)
+        chunks = [[bootstrap_ind for block in blocks[chunk[0]:chunk[-1] + 1] for bootstrap_ind in block]
+                  for chunk in np.array_split(np.arange(len(blocks)), n_jobs * 4) if len(chunk) > 0]
+        print(f'Fitting {len(bootstrap_inds)} bootstraps on {n_jobs} worker processes...')
+        chunk_params = joblib.Parallel(n_jobs=n_jobs)(
+            joblib.delayed(self._fit_bootstrap_replicates)(chunk) for chunk in chunks)
+        # re-key with our own sorted_names so the pickled cache file is byte-identical to a serial run's
+        return [{key: params[key] for key in self.sorted_names} for params_list in chunk_params for params in
+                params_list]
+
+    def _get_bootstrap_store_header(self):
+        '''
+        What the replicates in the bootstrap store depend on: the resampling, the starting point and the solver settings
+          Subclasses with their own bootstrap solvers add their settings, so a store fit one way is never extended
+          with replicates fit another way.
+        :return: dictionary
+        '''
+        return {'bootstrap_seed': self.bootstrap_seed,
+                'cases_indices': list(self.cases_indices),
+                'deaths_indices': list(self.deaths_indices),
+                'starting_point': [float(self.all_data_params[key]) for key in self.sorted_names],
+                'bootstrap_block_size': self.bootstrap_block_size}
 
-        # TODO: Break out all-data fit to its own method, not embedded in render_bootstraps
-        if (not success and self.opt_calc) or self.opt_force_calc:
+    def _load_bootstrap_store(self):
+        '''
+        Read the append-only bootstrap store: a header record, then one record per checkpoint of fitted replicates
+          A record cut short by an interrupted run is dropped (and truncated away, so appending can carry on after the
+          last complete checkpoint). A store with a different header is ignored, and replaced once there's a new replicate
+          to save.
+        :return: dictionary of replicate index -> params, empty if there's no usable store
+        '''
+        map_bootstrap_ind_to_params = dict()
+        if not path.exists(self.bootstrap_filename):
+            return map_bootstrap_ind_to_params
+
+        with open(self.bootstrap_filename, 'rb+') as f:
+            try:
+                header = pickle.load(f)
+            except:
+                header = None
+            if header != self._get_bootstrap_store_header():
+                print(f'{self.bootstrap_filename} is out of date, ignoring it...')
+                return map_bootstrap_ind_to_params
 
-            print('\n----\nRendering bootstrap model fits... now going through bootstraps...\n----')
-            for bootstrap_ind in tqdm(range(self.n_bootstraps)):
-                # get bootstrap indices by concatenating cases and deaths
-                bootstrap_tuples = [('cases', x) for x in self.cases_indices] + [('deaths', x) for x in
-                                                                                 self.deaths_indices]
-                bootstrap_indices_tuples = np.random.choice(list(range(len(bootstrap_tuples))), len(bootstrap_tuples),
-                                                            replace=True)
-                cases_bootstrap_indices = [bootstrap_tuples[i][1] for i in bootstrap_indices_tuples if
-                                           bootstrap_tuples[i][0] == 'cases']
-                deaths_bootstrap_indices = [bootstrap_tuples[i][1] for i in bootstrap_indices_tuples if
-                                            bootstrap_tuples[i][0] == 'deaths']
-
-                # Add normal-distributed jitter with sigma=sqrt(N)
-                # tested_jitter = [
-                #     max(0.01, self.data_new_tested[i] + np.random.normal(0, np.sqrt(self.data_new_tested[i]))) for i in
-                #     range(len(self.data_new_tested))]
-                # dead_jitter = [max(0.01, self.data_new_dead[i] + np.random.normal(0, np.sqrt(self.data_new_dead[i])))
-                #                for i in
-                #                range(len(self.data_new_dead))]
-
-                # here is where we select the all-data parameters as our starting point
-                starting_point_as_list = [self.all_data_params[key] for key in self.sorted_names]
-
-                # params_as_dict, cov = self.fit_curve_via_likelihood(starting_point_as_list,
-                #                                                # data_tested=tested_jitter,
-                #                                                # data_dead=dead_jitter,
-                #                                                tested_indices=cases_bootstrap_indices,
-                #                                                deaths_indices=deaths_bootstrap_indices
-                #                                                )
-
-                params_as_dict = self.fit_curve_exactly_via_least_squares(starting_point_as_list,
-                                                                          # data_tested=tested_jitter,
-                                                                          # data_dead=dead_jitter,
-                                                                          tested_indices=cases_bootstrap_indices,
-                                                                          deaths_indices=deaths_bootstrap_indices
-                                                                          )
-
-                sol = self.run_simulation(params_as_dict)
-                bootstrap_sols.append(sol)
-                bootstrap_params.append(params_as_dict)
+            end_of_last_record = f.tell()
+            while True:
+                try:
+                    record = pickle.load(f)
+                except EOFError:
+                    break
+                except:
+                    print(f'dropping incomplete checkpoint at the end of {self.bootstrap_filename}')
+                    break
+                map_bootstrap_ind_to_params.update(zip(record['bootstrap_inds'], record['bootstrap_params']))
+                end_of_last_record = f.tell()
+            f.truncate(end_of_last_record)
+
+        return map_bootstrap_ind_to_params
+
+    def _append_to_bootstrap_store(self, bootstrap_inds, bootstrap_params):
+        '''
+        Checkpoint fitted replicates as one record at the end of the bootstrap store (starting it if necessary)
+          Only the parameters are stored, see bootstrap_sols for the trajectories.
+        '''
+        with open(self.bootstrap_filename, 'ab') as f:
+            if f.tell() == 0:
+                f.write(pickle.dumps(self._get_bootstrap_store_header()))
+            f.write(pickle.dumps({'bootstrap_inds': list(bootstrap_inds),
+                                  'bootstrap_params': bootstrap_params}))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _render_missing_bootstraps(self, map_bootstrap_ind_to_params, n_bootstraps):
+        '''
+        Fit whichever of the first n_bootstraps replicates aren't in map_bootstrap_ind_to_params yet
+          Checkpoints to bootstrap_filename every bootstrap_checkpoint_every fits, so an interrupted run picks up where
+          it stopped.
+        :param map_bootstrap_ind_to_params: replicate index -> params, updated in place
+        :param n_bootstraps: how many replicates we need
+        :return: True if anything was fit
+        '''
+        n_missing = len([i for i in range(n_bootstraps) if i not in map_bootstrap_ind_to_params])
+        if n_missing == 0 or not (self.opt_calc or self.opt_force_calc):
+            return False
+
+        print('\n----\nRendering bootstrap model fits... now going through bootstraps...\n----')
+        if map_bootstrap_ind_to_params:
+            print(f'...{n_bootstraps - n_missing} of {n_bootstraps} already done')
+        elif path.exists(self.bootstrap_filename):
+            os.remove(self.bootstrap_filename)  # nothing usable in it, start it over
+
+        # always fit whole blocks, so a replicate comes out the same however many bootstraps were asked for
+        n_to_fit = int(np.ceil(n_bootstraps / self.bootstrap_block_size)) * self.bootstrap_block_size
+        missing_bootstrap_blocks = self._get_bootstrap_blocks(
+            [i for i in range(n_to_fit) if i not in map_bootstrap_ind_to_params])
+
+        # checkpoint after every bootstrap_checkpoint_every replicates' worth of blocks
+        checkpoints = [[]]
+        for block in missing_bootstrap_blocks:
+            if len(checkpoints[-1]) >= self.bootstrap_checkpoint_every:
+                checkpoints.append([])
+            checkpoints[-1].extend(block)
+
+        for bootstrap_inds in checkpoints:
+            bootstrap_params = self._fit_bootstrap_replicates_in_parallel(bootstrap_inds)
 
             print(f'saving bootstraps to {self.bootstrap_filename}...')
-            joblib.dump({'bootstrap_sols': bootstrap_sols, 'bootstrap_params': bootstrap_params},
-                        self.bootstrap_filename)
-            print('...done!')
+            self._append_to_bootstrap_store(bootstrap_inds, bootstrap_params)
+            map_bootstrap_ind_to_params.update(zip(bootstrap_inds, bootstrap_params))
+        print('...done!')
+        return True
+
+    def _get_bootstrap_quantiles(self, bootstrap_params):
+        '''
+        The intervals opt_adaptive_bootstraps watches: 5th, 50th and 95th percentiles of each of plot_param_names, and
+          the 5th and 95th percentile bands of the positive and deceased forecasts. Bands only cover the days after the
+          last data day, since the burn-in days have bands far wider than their levels that never settle.
+        :param bootstrap_params: list of dictionaries
+        :return: (quantiles, widths) lists of numpy arrays, one entry per parameter percentile (length 1) or per band
+          (one value per forecast day), widths is the 5-95 width of the interval each quantile belongs to
+        '''
+        param_lists = [self.convert_params_as_dict_to_list(params) for params in bootstrap_params]
+        param_distros = list()
+        for name in self.plot_param_names:
+            if name in self.extra_params:
+                param_distros.append([self.extra_params[name](param_list) for param_list in param_lists])
+            else:
+                param_distros.append([param_list[self.map_name_to_sorted_ind[name]] for param_list in param_lists])
+        param_quantiles = np.nanpercentile(np.array(param_distros, dtype=np.float64), [5, 50, 95], axis=1)
+        param_widths = param_quantiles[2] - param_quantiles[0]
+
+        sols = self.run_simulation_batch(param_lists)
+        band_quantiles = np.percentile(sols[:, 1:, self.burn_in + len(self.series_data):], [5, 95], axis=0)
+        band_widths = band_quantiles[1] - band_quantiles[0]
+
+        quantiles = [param_quantiles[i, j:j + 1] for i in range(3) for j in range(len(self.plot_param_names))] + \
+                    [band_quantiles[i, row] for i in range(2) for row in range(2)]
+        widths = [param_widths[j:j + 1] for i in range(3) for j in range(len(self.plot_param_names))] + \
+                 [band_widths[row] for i in range(2) for row in range(2)]
+        return quantiles, widths
+
+    def _opt_bootstrap_quantiles_stable(self, quantiles, previous_quantiles, previous_widths):
+        '''
+        Did adding the last batch of bootstraps move every quantile by at most bootstrap_quantile_tol times the width of
+          its interval? A band is taken as a whole (its movement and its width summed over the forecast days), so one
+          noisy day doesn't hold back the rest.
+        :return: boolean
+        '''
+        return all(np.sum(np.abs(quantile - previous_quantile)) <= self.bootstrap_quantile_tol * np.sum(previous_width)
+                   for quantile, previous_quantile, previous_width in zip(quantiles, previous_quantiles, previous_widths))
+
+    def render_bootstraps(self):
+        '''
+        Compute the bootstrap solutions
+          Replicates are checkpointed to bootstrap_filename, so an interrupted run picks up where it stopped, and asking
+          for more bootstraps only fits the new ones.
+          With opt_adaptive_bootstraps, n_bootstraps is the batch size: batches are added until no quantile from
+          _get_bootstrap_quantiles moves by more than bootstrap_quantile_tol of its interval's width, or until
+          max_n_bootstraps. Replicates are deterministic, so a later run stops at the same count straight from the store.
+        :return: None
+        '''
+
+        if self.opt_force_calc and path.exists(self.bootstrap_filename):
+            os.remove(self.bootstrap_filename)
+        map_bootstrap_ind_to_params = self._load_bootstrap_store()
+        self.loaded_bootstraps = True
+
+        # TODO: Break out all-data fit to its own method, not embedded in render_bootstraps
+        n_bootstraps = self.n_bootstraps
+        if self.opt_adaptive_bootstraps:
+            n_bootstraps = min(n_bootstraps, self.max_n_bootstraps)
+        previous_quantiles = None
+        while True:
+            if self._render_missing_bootstraps(map_bootstrap_ind_to_params, n_bootstraps):
+                self.loaded_bootstraps = False
+            if any(i not in map_bootstrap_ind_to_params for i in range(n_bootstraps)):
+                self.loaded_bootstraps = False
+                break
+            if not self.opt_adaptive_bootstraps:
+                break
+
+            quantiles, widths = self._get_bootstrap_quantiles(
+                [map_bootstrap_ind_to_params[i] for i in range(n_bootstraps)])
+            if previous_quantiles is not None and \
+                    self._opt_bootstrap_quantiles_stable(quantiles, previous_quantiles, previous_widths):
+                print(f'Bootstrap intervals settled after {n_bootstraps} bootstraps')
+                break
+            if n_bootstraps >= self.max_n_bootstraps:
+                print(f'Bootstrap intervals still moving at max_n_bootstraps={self.max_n_bootstraps}, stopping there')
+                break
+            previous_quantiles, previous_widths = quantiles, widths
+            n_bootstraps = min(n_bootstraps + self.n_bootstraps, self.max_n_bootstraps)
+
+        # whatever's stored past n_bootstraps stays in the store for a later, bigger run
+        bootstrap_params = [map_bootstrap_ind_to_params[i] for i in range(n_bootstraps) if
+                            i in map_bootstrap_ind_to_params]
 
         print('\nParameters when trained on all data (this is our starting point for optimization):')
         [print(f'{key}: {val:.4g}') for key, val in self.all_data_params.items()]
@@ -1238,7 +1680,6 @@ class BayesModel(ABC):
             for extra_param, extra_param_func in self.extra_params.items():
                 params[extra_param] = extra_param_func([params[name] for name in self.sorted_names])
 
-        self.bootstrap_sols = bootstrap_sols
         self.bootstrap_params = bootstrap_params
 
         bootstrap_weights = [1] * len(self.bootstrap_params)
@@ -1285,28 +1726,16 @@ class BayesModel(ABC):
             if n_samples is None:
                 n_samples = self.n_likelihood_samples
 
-            all_samples = list()
-            all_log_probs = list()
             print('\n----\nRendering likelihood samples...\n----')
-            for _ in tqdm(range(n_samples)):
-                indiv_sample_dict = dict()
-                for param_name in self.sorted_names:
-                    indiv_sample_dict[param_name] = \
-                        np.random.uniform(bounds_to_use[param_name][0], bounds_to_use[param_name][1], 1)[0]
-                all_samples.append(indiv_sample_dict)
-                all_log_probs.append(
-                    self.get_log_likelihood(
-                        indiv_sample_dict))  # this is the part that takes a while? Still surprised this takes so long
-
-            all_samples_as_list = list()
-            all_log_probs_as_list = list()
-            for i in tqdm(range(n_samples)):
-                if not np.isfinite(all_log_probs[i]):
-                    continue
-                else:
-                    sample_as_list = np.array([float(all_samples[i][name]) for name in self.map_name_to_sorted_ind])
-                    all_samples_as_list.append(sample_as_list)
-                    all_log_probs_as_list.append(all_log_probs[i])
+            # NB: same draws, in the same order, as sampling one parameter at a time for each sample
+            all_samples = np.random.uniform([bounds_to_use[param_name][0] for param_name in self.sorted_names],
+                                            [bounds_to_use[param_name][1] for param_name in self.sorted_names],
+                                            (n_samples, len(self.sorted_names)))
+            all_log_probs = self.get_log_likelihood_batch(all_samples)
+
+            is_finite = np.isfinite(all_log_probs)
+            all_samples_as_list = list(all_samples[is_finite])
+            all_log_probs_as_list = list(all_log_probs[is_finite])
 
             all_propensities_as_list = [len(all_samples_as_list)] * len(all_samples_as_list)
             print(f'saving samples to {self.likelihood_samples_filename_format_str.format("medium")}...')
@@ -1626,7 +2055,7 @@ class BayesModel(ABC):
 
         weight_sampled_params = self.hessian_model.rvs(n_samples)
 
-        log_probs = [self.get_log_likelihood(x) for x in weight_sampled_params]
+        log_probs = self.get_log_likelihood_batch(weight_sampled_params)
 
         return weight_sampled_params, weight_sampled_params, [1] * len(weight_sampled_params), log_probs
 
@@ -1634,14 +2063,14 @@ class BayesModel(ABC):
         if not mvn_fit:
             if approx_type == ApproxType.BS:
                 params = self.bootstrap_params
-                log_probs = [self.get_log_likelihood(x) for x in params]
+                log_probs = self.get_log_likelihood_batch(params)
                 weights = [1] * len(params)
                 weighted_params = params
             elif approx_type == ApproxType.LS:
                 weighted_params, params, weights, log_probs = self.get_weighted_samples_via_direct_sampling()
             elif approx_type == ApproxType.MCMC:
                 params = self.all_random_walk_samples_as_list
-                log_probs = [self.get_log_likelihood(x) for x in params]
+                log_probs = self.get_log_likelihood_batch(params)
                 weights = [1] * len(params)
                 weighted_params = params
             elif approx_type == ApproxType.SM:
@@ -1801,7 +2230,7 @@ class BayesModel(ABC):
             raise ValueError('Need to fit MVN to likelihood samples')
 
         weight_sampled_params = self.map_approx_type_to_MVN[approx_type]['model'].rvs(n_samples)
-        log_probs = [self.get_log_likelihood(x) for x in weight_sampled_params]
+        log_probs = self.get_log_likelihood_batch(weight_sampled_params)
 
         return weight_sampled_params, weight_sampled_params, [1] * len(weight_sampled_params), log_probs
 
@@ -2088,6 +2517,15 @@ class BayesModel(ABC):
         # Next define GMM model on likelihood and fit
         # self.fit_GMM_to_likelihood()
 
+    @property
+    def bootstrap_sols(self):
+        '''
+        Bootstrap trajectories, re-simulated in one batch from bootstrap_params whenever they're asked for
+          They're a 3 x len(t_vals) array per replicate, so they're neither stored nor kept around.
+        :return: list of numpy arrays, one per bootstrap replicate
+        '''
+        return list(self.run_simulation_batch(self.bootstrap_params))
+
     @property
     def opt_plot_bootstraps(self):
         return (not self.loaded_bootstraps) or self.opt_force_plot
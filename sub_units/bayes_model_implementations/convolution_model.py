@@ -1,8 +1,14 @@
 from sub_units.bayes_model import BayesModel
+from sub_units import compiled_kernels
 from scipy.integrate import odeint
+import scipy as sp
+import scipy.fft
+import scipy.sparse
 import numpy as np
 import datetime
+from collections import OrderedDict
 from sub_units.utils import ApproxType
+from tqdm import tqdm
 
 
 class ConvolutionModel(BayesModel):
@@ -11,10 +17,20 @@ class ConvolutionModel(BayesModel):
     def __init__(self,
                  *args,
                  optimizer_method='Nelder-Mead',  # 'Nelder-Mead', #'SLSQP',
+                 opt_odeint=False,  # integrate _ODE_system numerically instead of using its closed form (for validation)
+                 kernel_truncation_widths=6,  # kernels keep only the days within this many widths of their delay
+                 fft_max_dynamic_range=1e8,  # batched convolutions of signals spanning more than this don't use FFT
+                 opt_block_bootstraps=True,  # fit bootstrap replicates in blocks, see _fit_bootstrap_replicates
+                 bootstrap_block_size=5,
                  **kwargs):
         kwargs.update({'model_type_name': 'convolution',
                        'min_sol_date': None,  # TODO: find a better way to set this attribute
                        'optimizer_method': optimizer_method,
+                       'opt_odeint': opt_odeint,
+                       'kernel_truncation_widths': kernel_truncation_widths,
+                       'fft_max_dynamic_range': fft_max_dynamic_range,
+                       'opt_block_bootstraps': opt_block_bootstraps,
+                       'bootstrap_block_size': bootstrap_block_size,
                        })
         super(ConvolutionModel, self).__init__(*args, **kwargs)
         self.cases_indices = list(range(self.day_of_threshold_met_case, len(self.series_data)))
@@ -24,6 +40,30 @@ class ConvolutionModel(BayesModel):
         # self.cases_indices = [i for i in cases_indices if self.data_new_tested[i] > 0]
         # self.deaths_indices = [i for i in deaths_indices if self.data_new_dead[i] > 0]
 
+        # where run_simulation finds its parameters in the full parameter vector
+        self.alpha_slots = self.param_layout.get_slots(['alpha_1', 'alpha_2'])
+        self.I_0_slot = self.param_layout.get_slot('I_0')
+        self.delay_slots = self.param_layout.get_slots(['contagious_to_positive_delay',
+                                                        'contagious_to_deceased_delay'])
+        self.width_slots = self.param_layout.get_slots(['contagious_to_positive_width',
+                                                        'contagious_to_deceased_width'])
+        self.deceased_mult_slot = self.param_layout.get_slot('contagious_to_deceased_mult')
+
+        # integral of the sigmoid in _ODE_system from t_vals[0] to each t_val, see _get_contagious_closed_form
+        self.elapsed_t_vals = self.t_vals - self.t_vals[0]
+        self.integrated_sigmoid = np.logaddexp(0, self.t_vals - self.SIP_date_in_days) - \
+                                  np.logaddexp(0, self.t_vals[0] - self.SIP_date_in_days)
+
+        # (delay, width) -> truncated convolution kernel, least recently used first, see _get_convolution_kernel
+        self._kernel_cache = OrderedDict()
+        self._kernel_cache_max_size = 64
+
+    def __getstate__(self):
+        # the kernel cache is cheap to refill, don't ship it to bootstrap workers or save it with the model
+        state = self.__dict__.copy()
+        state['_kernel_cache'] = OrderedDict()
+        return state
+
     @staticmethod
     def _ODE_system(y, t, *p):
         '''
@@ -43,51 +83,200 @@ class ConvolutionModel(BayesModel):
         #     for that you may need delay ODE solvers
         return [di]
 
-    def run_simulation(self, in_params):
+    def _get_contagious_closed_form(self, I_0, alpha_1, alpha_2, n_days=None):
+        '''
+        Exact solution of _ODE_system on t_vals: dI/dt = r(t) * I with r(t) = alpha_1 + (alpha_2 - alpha_1) * sigmoid(t - SIP)
+          integrates to I(t) = I_0 * exp(alpha_1 * (t - t0) + (alpha_2 - alpha_1) * (softplus(t - SIP) - softplus(t0 - SIP)))
+        :param n_days: only solve for the first n_days t_vals, defaults to all of them
+        :return: numpy array of contagious counts, one per t_val
+        '''
+        return I_0 * np.exp(alpha_1 * self.elapsed_t_vals[:n_days] + (alpha_2 - alpha_1) * self.integrated_sigmoid[:n_days])
+
+    def _get_convolution_kernel(self, delay, width):
+        '''
+        Normalized Gaussian kernel on the day lattice 0, 1, ..., len(t_vals), truncated to the days that carry weight
+          Keeps the days within kernel_truncation_widths widths of the delay (clipped onto the lattice), the ones dropped
+          weigh less than exp(-kernel_truncation_widths ** 2) relative to the ones kept. Fitted delays hardly ever repeat
+          exactly (and snapping them to a grid would flatten the finite-difference gradients the optimizers see), so
+          only the last _kernel_cache_max_size kernels are kept, enough for repeats like re-simulating the all-data fit.
+        :param delay: kernel center in days
+        :param width: kernel width in days
+        :return: tuple of (first day kept, numpy array of kernel weights from that day on)
+        '''
+        key = (delay, width)
+        if key in self._kernel_cache:
+            self._kernel_cache.move_to_end(key)
+            return self._kernel_cache[key]
+
+        n_days = len(self.t_vals)
+        center = min(max(delay, 0), n_days)
+        start = int(max(np.floor(center - self.kernel_truncation_widths * width), 0))
+        stop = int(min(np.ceil(center + self.kernel_truncation_widths * width), n_days)) + 1
+        convolution_kernel = self.norm(np.arange(start, stop, dtype=np.float64), mu=delay, std=width)
+        kernel_sum = convolution_kernel.sum()
+        if kernel_sum == 0:
+            convolution_kernel = np.zeros_like(convolution_kernel)
+        else:
+            convolution_kernel /= kernel_sum
+
+        self._kernel_cache[key] = (start, convolution_kernel)
+        if len(self._kernel_cache) > self._kernel_cache_max_size:
+            self._kernel_cache.popitem(last=False)
+        return start, convolution_kernel
+
+    @staticmethod
+    def _convolve(signal, start, convolution_kernel):
+        '''
+        First len(signal) values of the convolution of signal with a kernel that is zero before day start
+        :param signal: numpy array
+        :param start: first day of the truncated kernel
+        :param convolution_kernel: numpy array of kernel weights from day start on
+        :return: numpy array, same length as signal
+        '''
+        n_days = len(signal)
+        convolved = np.zeros(n_days)
+        if start < n_days:
+            convolved[start:] = np.convolve(signal[:n_days - start], convolution_kernel)[:n_days - start]
+        return convolved
+
+    def _get_convolution_kernel_batch(self, delays, widths):
+        '''
+        Normalized Gaussian kernels on the day lattice for many (delay, width) pairs at once, one row each
+        :param delays: N kernel delays
+        :param widths: N kernel widths
+        :return: (N, len(t_vals) + 1) numpy array
+        '''
+        day_lattice = np.arange(len(self.t_vals) + 1, dtype=np.float64)
+        convolution_kernels = self.norm(day_lattice[np.newaxis, :],
+                                        mu=np.asarray(delays)[:, np.newaxis],
+                                        std=np.asarray(widths)[:, np.newaxis])
+        kernel_sums = convolution_kernels.sum(axis=1, keepdims=True)
+        return np.divide(convolution_kernels, kernel_sums, out=np.zeros_like(convolution_kernels),
+                         where=kernel_sums != 0)
+
+    def _convolve_batch(self, signals, delays, widths, opt_fft=True):
+        '''
+        _convolve for every row of a signal matrix, each with its own (delay, width) kernel
+          Uses one batched FFT when the rows span at most fft_max_dynamic_range, since FFT round-off is relative to each
+          row's largest value, and falls back on row-by-row truncated direct convolution otherwise.
+        :param signals: (N, T) numpy array
+        :param delays: N kernel delays
+        :param widths: N kernel widths
+        :param opt_fft: False to always use direct convolution, e.g. for finite differences, which FFT round-off swamps
+        :return: (N, T) numpy array
+        '''
+        n_rows, n_days = signals.shape
+
+        abs_signals = np.abs(signals)
+        opt_fft = opt_fft and n_rows > 1 and \
+                  np.all(abs_signals.max(axis=1) <= self.fft_max_dynamic_range * abs_signals.min(axis=1))
+        if not opt_fft:
+            return np.array([self._convolve(signal, *self._get_convolution_kernel(delay, width))
+                             for signal, delay, width in zip(signals, delays, widths)]).reshape(n_rows, n_days)
+
+        # the last lattice day only reaches past the end of the signal, so it's left out of the transform
+        kernel_matrix = self._get_convolution_kernel_batch(delays, widths)[:, :n_days]
+        n_fft = sp.fft.next_fast_len(2 * n_days - 1, real=True)
+        return sp.fft.irfft(sp.fft.rfft(signals, n_fft, axis=1) * sp.fft.rfft(kernel_matrix, n_fft, axis=1),
+                            n_fft, axis=1)[:, :n_days]
+
+    def _get_n_days_to_simulate(self, sol_indices):
+        '''
+        Everything is causal, so simulating sol_indices only takes the t_vals up to the last one of them
+        :return: int
+        '''
+        if sol_indices is None:
+            return len(self.t_vals)
+        return int(np.max(sol_indices, initial=0)) + 1
+
+    def run_simulation(self, in_params, sol_indices=None):
         '''
         run combined ODE and convolution simulation
         :param params: dictionary of relevant parameters
+        :param sol_indices: which points of t_vals to return (e.g. just the likelihood window), defaults to all of them
         :return: N
         '''
 
-        params = self.convert_params_as_list_to_dict(in_params)
+        params = self.param_layout.get_full_vector(in_params)
+        n_days = self._get_n_days_to_simulate(sol_indices)
+        positive_delay, deceased_delay = params[self.delay_slots]
+        positive_width, deceased_width = params[self.width_slots]
 
-        params.update(self.static_params)
+        if self.opt_numba and not self.opt_odeint:
+            sol = compiled_kernels.convolution_trajectories(self.elapsed_t_vals,
+                                                            self.integrated_sigmoid,
+                                                            params[self.I_0_slot],
+                                                            *params[self.alpha_slots],
+                                                            *self._get_convolution_kernel(positive_delay, positive_width),
+                                                            0.1,  # params['contagious_to_positive_mult']
+                                                            *self._get_convolution_kernel(deceased_delay, deceased_width),
+                                                            params[self.deceased_mult_slot],
+                                                            n_days)
+            if sol_indices is None:
+                return sol
+            return sol[:, np.asarray(sol_indices, dtype=int)]
 
         # First we simulate how the growth rate results into total # of contagious
-        param_tuple = tuple(params[x] for x in ['alpha_1', 'alpha_2']) + (self.SIP_date_in_days,)
-        contagious = odeint(self._ODE_system,
-                            [params['I_0']],
-                            self.t_vals,
-                            args=param_tuple)
-        contagious = np.array(contagious)
+        if self.opt_odeint:
+            param_tuple = tuple(params[self.alpha_slots]) + (self.SIP_date_in_days,)
+            contagious = odeint(self._ODE_system,
+                                [params[self.I_0_slot]],
+                                self.t_vals,
+                                args=param_tuple)
+            contagious = np.array(contagious)[:n_days]
+        else:
+            contagious = self._get_contagious_closed_form(params[self.I_0_slot], *params[self.alpha_slots],
+                                                          n_days=n_days)
 
         # then use convolution to simulate transition to positive
-        convolution_kernel = self.norm(np.linspace(0, len(self.t_vals), len(self.t_vals) + 1),
-                                       mu=params['contagious_to_positive_delay'],
-                                       std=params['contagious_to_positive_width'])
-        if sum(convolution_kernel) == 0:
-            convolution_kernel = np.zeros_like(convolution_kernel)
-        else:
-            convolution_kernel /= sum(convolution_kernel)
-        convolution_kernel = np.array(convolution_kernel)
-        positive = np.convolve(np.squeeze(contagious),
-                               convolution_kernel) * 0.1  # params['contagious_to_positive_mult']
+        positive = self._convolve(np.squeeze(contagious), *self._get_convolution_kernel(positive_delay, positive_width)) \
+                   * 0.1  # params['contagious_to_positive_mult']
 
         # then use convolution to simulate transition to deceased
-        convolution_kernel = self.norm(np.linspace(0, len(self.t_vals), len(self.t_vals) + 1),
-                                       mu=params['contagious_to_deceased_delay'],
-                                       std=params['contagious_to_deceased_width'])
-        if sum(convolution_kernel) == 0:
-            convolution_kernel = np.zeros_like(convolution_kernel)
+        deceased = self._convolve(np.squeeze(contagious), *self._get_convolution_kernel(deceased_delay, deceased_width)) \
+                   * params[self.deceased_mult_slot]
+
+        sol = np.vstack([np.maximum(np.squeeze(contagious), 0),
+                         np.maximum(np.array(positive[:contagious.size]), 0),
+                         np.maximum(np.array(deceased[:contagious.size]), 0)])
+        if sol_indices is None:
+            return sol
+        return sol[:, np.asarray(sol_indices, dtype=int)]
+
+    def run_simulation_batch(self, param_matrix, sol_indices=None, opt_fft=True):
+        '''
+        Vectorized run_simulation: closed-form contagious curves, batched kernels and batched convolution for all rows
+        :param param_matrix: (N, n_params) array in sorted_names order, or a list of parameter lists or dictionaries
+        :param sol_indices: which points of t_vals to return, defaults to all of them
+        :param opt_fft: see _convolve_batch
+        :return: (N, 3, T) numpy array of contagious, positive and deceased trajectories
+        '''
+        full_matrix = self.param_layout.get_full_matrix(self._get_param_matrix(param_matrix))
+        n_days = self._get_n_days_to_simulate(sol_indices)
+
+        if self.opt_odeint:
+            contagious = np.array([self.run_simulation(params)[0, :n_days] for params in full_matrix]).reshape(
+                len(full_matrix), -1)
         else:
-            convolution_kernel /= sum(convolution_kernel)
-        convolution_kernel = np.array(convolution_kernel)
-        deceased = np.convolve(np.squeeze(contagious), convolution_kernel) * params['contagious_to_deceased_mult']
+            contagious = self._get_contagious_closed_form(full_matrix[:, self.I_0_slot, np.newaxis],
+                                                          full_matrix[:, self.alpha_slots[0], np.newaxis],
+                                                          full_matrix[:, self.alpha_slots[1], np.newaxis],
+                                                          n_days=n_days)
+
+        positive = self._convolve_batch(contagious,
+                                        full_matrix[:, self.delay_slots[0]],
+                                        full_matrix[:, self.width_slots[0]],
+                                        opt_fft=opt_fft) * 0.1  # contagious_to_positive_mult
+        deceased = self._convolve_batch(contagious,
+                                        full_matrix[:, self.delay_slots[1]],
+                                        full_matrix[:, self.width_slots[1]],
+                                        opt_fft=opt_fft) * \
+                   full_matrix[:, self.deceased_mult_slot, np.newaxis]
 
-        return np.vstack([np.maximum(np.squeeze(contagious), 0),
-                          np.maximum(np.array(positive[:contagious.size]), 0),
-                          np.maximum(np.array(deceased[:contagious.size]), 0)])
+        sols = np.stack([np.maximum(contagious, 0), np.maximum(positive, 0), np.maximum(deceased, 0)], axis=1)
+        if sol_indices is None:
+            return sols
+        return sols[:, :, np.asarray(sol_indices, dtype=int)]
 
     def _get_log_likelihood_precursor(self,
                                       in_params,
@@ -104,45 +293,155 @@ class ConvolutionModel(BayesModel):
         :param deaths_bootstrap_indices:  bootstrap indices when applicable
         :param cases_bootstrap_indices: which indices to include in the likelihood?
         :param deaths_bootstrap_indices: which indices to include in the likelihood?
-        :return: tuple of lists: distances, other errors, and simulated solution
+        :return: tuple of numpy arrays: distances, other errors, and simulated solution (at the cases indices, then
+                 the deaths indices)
         '''
 
-        # convert from list to dictionary (for compatibility with the least-sq solver
-        params = self.convert_params_as_list_to_dict(in_params)
+        # full parameter vector, static params included (lists come from the least-sq solver)
+        params = self.param_layout.get_full_vector(in_params)
+
+        if cases_bootstrap_indices is None:
+            cases_bootstrap_indices = self.cases_indices
+        if deaths_bootstrap_indices is None:
+            deaths_bootstrap_indices = self.deaths_indices
+        cases_bootstrap_indices = np.asarray(cases_bootstrap_indices, dtype=int)
+        deaths_bootstrap_indices = np.asarray(deaths_bootstrap_indices, dtype=int)
+
+        actual_tested = self._get_log_actual(data_new_tested, cases_bootstrap_indices, 'tested')
+        actual_dead = self._get_log_actual(data_new_dead, deaths_bootstrap_indices, 'dead')
 
         if data_new_tested is None:
             data_new_tested = self.data_new_tested
         if data_new_dead is None:
             data_new_dead = self.data_new_dead
 
+        # only simulate the days the likelihood looks at
+        n_cases = len(cases_bootstrap_indices)
+        sol = self.run_simulation(params, sol_indices=np.concatenate([cases_bootstrap_indices,
+                                                                      deaths_bootstrap_indices]) + self.burn_in)
+
+        predicted_tested = np.log(sol[1, :n_cases] + self.log_offset)
+        predicted_dead = np.log(sol[2, n_cases:] + self.log_offset)
+
+        new_tested_dists = predicted_tested - actual_tested
+        new_dead_dists = predicted_dead - actual_dead
+
+        # ensure the two delays are physical
+        val1, val2 = params[self.delay_slots]
+        err_from_reversed_delays = val1 - val2 if val1 > val2 else 0
+
+        tested_vals = np.asarray(data_new_tested)[cases_bootstrap_indices]
+        deceased_vals = np.asarray(data_new_dead)[deaths_bootstrap_indices]
+        other_errs = np.array([err_from_reversed_delays])
+
+        return new_tested_dists, new_dead_dists, other_errs, sol, tested_vals, deceased_vals, \
+               predicted_tested, actual_tested, predicted_dead, actual_dead
+
+    def _get_log_likelihood_precursor_batch(self,
+                                            param_matrix,
+                                            data_new_tested=None,
+                                            data_new_dead=None,
+                                            cases_bootstrap_indices=None,
+                                            deaths_bootstrap_indices=None):
+        '''
+        Vectorized _get_log_likelihood_precursor over the rows of a parameter matrix
+        :param param_matrix: (N, n_params) array
+        :return: tuple of (N, n_cases) distances, (N, n_deaths) distances, (N, 1) other errors
+        '''
         if cases_bootstrap_indices is None:
             cases_bootstrap_indices = self.cases_indices
         if deaths_bootstrap_indices is None:
             deaths_bootstrap_indices = self.deaths_indices
+        cases_bootstrap_indices = np.asarray(cases_bootstrap_indices, dtype=int)
+        deaths_bootstrap_indices = np.asarray(deaths_bootstrap_indices, dtype=int)
 
-        # timer = Stopwatch()
-        sol = self.run_simulation(params)
-        new_tested_from_sol = sol[1]
-        new_deceased_from_sol = sol[2]
-        # print(f'Simulation took {timer.elapsed_time() * 100} ms')
-        # timer = Stopwatch()
-
-        actual_tested = [np.log(data_new_tested[i] + self.log_offset) for i in cases_bootstrap_indices]
-        predicted_tested = [np.log(new_tested_from_sol[i + self.burn_in] + self.log_offset) for i in cases_bootstrap_indices]
-        actual_dead = [np.log(data_new_dead[i] + self.log_offset) for i in deaths_bootstrap_indices]
-        predicted_dead = [np.log(new_deceased_from_sol[i + self.burn_in] + self.log_offset) for i in deaths_bootstrap_indices]
+        actual_tested = self._get_log_actual(data_new_tested, cases_bootstrap_indices, 'tested')
+        actual_dead = self._get_log_actual(data_new_dead, deaths_bootstrap_indices, 'dead')
 
-        new_tested_dists = [predicted_tested[i] - actual_tested[i] for i in range(len(predicted_tested))]
-        new_dead_dists = [predicted_dead[i] - actual_dead[i] for i in range(len(predicted_dead))]
+        n_cases = len(cases_bootstrap_indices)
+        sols = self.run_simulation_batch(param_matrix,
+                                         sol_indices=np.concatenate([cases_bootstrap_indices,
+                                                                     deaths_bootstrap_indices]) + self.burn_in)
+        predicted_tested = np.log(sols[:, 1, :n_cases] + self.log_offset)
+        predicted_dead = np.log(sols[:, 2, n_cases:] + self.log_offset)
 
         # ensure the two delays are physical
-        val1 = params['contagious_to_positive_delay']
-        val2 = params['contagious_to_deceased_delay']
-        err_from_reversed_delays = val1 - val2 if val1 > val2 else 0
+        full_matrix = self.param_layout.get_full_matrix(param_matrix)
+        err_from_reversed_delays = np.maximum(full_matrix[:, self.delay_slots[0]] - full_matrix[:, self.delay_slots[1]], 0)
 
-        tested_vals = [data_new_tested[i] for i in cases_bootstrap_indices]
-        deceased_vals = [data_new_dead[i] for i in deaths_bootstrap_indices]
-        other_errs = [err_from_reversed_delays]
+        return predicted_tested - actual_tested, predicted_dead - actual_dead, err_from_reversed_delays[:, np.newaxis]
 
-        return new_tested_dists, new_dead_dists, other_errs, sol, tested_vals, deceased_vals, \
-               predicted_tested, actual_tested, predicted_dead, actual_dead
+    def _fit_bootstrap_block(self, bootstrap_inds):
+        '''
+        Fit a block of bootstrap replicates as one least-squares problem, each replicate starting from the all-data fit
+          The replicates don't share parameters, so the joint Jacobian is block diagonal. Given that sparsity,
+          scipy.optimize.least_squares finite-differences all the blocks with the same n_fit residual evaluations, and
+          each residual evaluation simulates the whole block with one run_simulation_batch call. Bigger blocks cut more
+          overhead, but they also share one trust region, so the replicates that converge slowly hold up the others.
+        :param bootstrap_inds: which replicates (see _get_bootstrap_counts)
+        :return: list of parameter dictionaries, one per replicate
+        '''
+        all_cases_counts, all_deaths_counts = self._get_bootstrap_counts(bootstrap_inds)
+        n_block = len(bootstrap_inds)
+        n_fit = self.param_layout.n_fit
+
+        cases_indices = np.asarray(self.cases_indices, dtype=int)
+        deaths_indices = np.asarray(self.deaths_indices, dtype=int)
+        n_cases = len(cases_indices)
+        sol_indices = np.concatenate([cases_indices, deaths_indices]) + self.burn_in
+        actual = np.concatenate([self._get_log_actual(None, cases_indices, 'tested'),
+                                 self._get_log_actual(None, deaths_indices, 'dead')])
+        # same residuals as _errfunc_for_least_squares, with each point weighted by how often it was drawn
+        sqrt_weights = np.sqrt(np.hstack([all_cases_counts, all_deaths_counts]) / 2)
+
+        def errfunc(x):
+            param_matrix = x.reshape(n_block, n_fit)
+            # direct convolution, FFT round-off would swamp the finite differences
+            sols = self.run_simulation_batch(param_matrix, sol_indices=sol_indices, opt_fft=False)
+            predicted = np.log(np.hstack([sols[:, 1, :n_cases], sols[:, 2, n_cases:]]) + self.log_offset)
+
+            # ensure the two delays are physical
+            full_matrix = self.param_layout.get_full_matrix(param_matrix)
+            err_from_reversed_delays = np.maximum(
+                full_matrix[:, self.delay_slots[0]] - full_matrix[:, self.delay_slots[1]], 0)
+
+            return np.hstack([sqrt_weights * (predicted - actual), err_from_reversed_delays[:, np.newaxis]]).ravel()
+
+        starting_point_as_list = [self.all_data_params[key] for key in self.sorted_names]
+        results = sp.optimize.least_squares(errfunc,
+                                            np.tile(starting_point_as_list, n_block),
+                                            jac_sparsity=sp.sparse.block_diag(
+                                                [np.ones((len(actual) + 1, n_fit))] * n_block),
+                                            bounds=(
+                                                np.tile([self.curve_fit_bounds[name][0] for name in self.sorted_names],
+                                                        n_block),
+                                                np.tile([self.curve_fit_bounds[name][1] for name in self.sorted_names],
+                                                        n_block)),
+                                            # the block shares one trust region, scaling by the Jacobian keeps a
+                                            #   replicate with steep residuals from holding back the other ones
+                                            x_scale='jac')
+
+        return [dict(zip(self.sorted_names, params)) for params in results.x.reshape(n_block, n_fit)]
+
+    def _get_bootstrap_store_header(self):
+        header = super(ConvolutionModel, self)._get_bootstrap_store_header()
+        header['opt_block_bootstraps'] = self.opt_block_bootstraps
+        return header
+
+    def _fit_bootstrap_replicates(self, bootstrap_inds, opt_progress_bar=False):
+        '''
+        Fit bootstrap replicates a block at a time (see BayesModel._get_bootstrap_blocks) with _fit_bootstrap_block,
+          which amortizes the solver's and the simulation's per-call overhead over the block.
+          Set opt_block_bootstraps=False for one-by-one fits.
+        :param bootstrap_inds: which replicates (see _get_bootstrap_counts)
+        :param opt_progress_bar: show a tqdm progress bar
+        :return: list of parameter dictionaries, one per replicate
+        '''
+        if not self.opt_block_bootstraps:
+            return super(ConvolutionModel, self)._fit_bootstrap_replicates(bootstrap_inds,
+                                                                            opt_progress_bar=opt_progress_bar)
+
+        bootstrap_params = list()
+        for block in tqdm(self._get_bootstrap_blocks(bootstrap_inds), disable=not opt_progress_bar):
+            bootstrap_params.extend(self._fit_bootstrap_block(block))
+        return bootstrap_params
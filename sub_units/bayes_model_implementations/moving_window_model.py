@@ -1,4 +1,5 @@
 from sub_units.bayes_model import BayesModel, ApproxType
+from sub_units import compiled_kernels
 import numpy as np
 import pandas as pd
 import datetime
@@ -18,6 +19,7 @@ class MovingWindowModel(BayesModel):
                  moving_window_size=14,
                  optimizer_method='SLSQP',
                  opt_simplified=False,
+                 opt_closed_form_bootstraps=True,
                  **kwargs):
         min_sol_date = datetime.datetime.strptime(max_date_str, '%Y-%m-%d') - datetime.timedelta(
             days=moving_window_size)
@@ -38,6 +40,7 @@ class MovingWindowModel(BayesModel):
                        'model_approx_types': model_approx_types,
                        'moving_window_size': moving_window_size,
                        'opt_simplified': opt_simplified,
+                       'opt_closed_form_bootstraps': opt_closed_form_bootstraps,
                        'plot_two_vals': ['positive_slope', 'positive_intercept']})
         super(MovingWindowModel, self).__init__(state, max_date_str, **kwargs)
 
@@ -50,78 +53,83 @@ class MovingWindowModel(BayesModel):
         # self.cases_indices = [i for i in cases_indices if self.data_new_tested[i] > 0]
         # self.deaths_indices = [i for i in deaths_indices if self.data_new_dead[i] > 0]
 
-    def run_simulation(self, in_params):
+        # where run_simulation finds its parameters in the full parameter vector (rows are positive, deceased)
+        self.slope_slots = self.param_layout.get_slots(['positive_slope', 'deceased_slope'])
+        self.intercept_slots = self.param_layout.get_slots(['positive_intercept', 'deceased_intercept'])
+        self.day_of_week_multiplier_slots = np.array(
+            [self.param_layout.get_slots([f'day{i}_{name}_multiplier' for i in range(7)])
+             for name in ['positive', 'deceased']])
+        self.day_of_week_inds = np.arange(len(self.t_vals)) % 7
+
+    def run_simulation(self, in_params, sol_indices=None):
         '''
         run combined ODE and convolution simulation
         :param params: dictionary of relevant parameters
+        :param sol_indices: which points of t_vals to simulate (e.g. just the likelihood window), defaults to all of them
         :return: N
         '''
 
-        params = self.convert_params_as_list_to_dict(in_params)
+        params = self.param_layout.get_full_vector(in_params)
+
+        if sol_indices is None:
+            t_vals = self.t_vals
+            day_of_week_inds = self.day_of_week_inds
+        else:
+            sol_indices = np.asarray(sol_indices, dtype=int)
+            t_vals = self.t_vals[sol_indices]
+            day_of_week_inds = self.day_of_week_inds[sol_indices]
+
+        contagious = np.array([None] * len(t_vals))  # this guy doesn't matter for MovingWindowModel
 
-        params.update(self.static_params)
-        contagious = np.array([None] * len(self.t_vals))  # this guy doesn't matter for MovingWindowModel
+        # rows are positive, deceased
+        slopes = params[self.slope_slots]
+        intercepts = params[self.intercept_slots]
+        day_of_week_multipliers = params[self.day_of_week_multiplier_slots]
 
         # do intercept at the beginning of moving window
         intercept_t_val = self.max_date_in_days - self.moving_window_size
-        xzero_positive_count = np.exp(intercept_t_val * params['positive_slope'])
-        xzero_deceased_count = np.exp(intercept_t_val * params['deceased_slope'])
-        positive = np.maximum(np.array(np.exp(self.t_vals * params['positive_slope'])) * np.array(
-            (params['positive_intercept'] - self.log_offset) / xzero_positive_count), 0)
-        deceased = np.maximum(np.array(np.exp(self.t_vals * params['deceased_slope'])) * np.array(
-            (params['deceased_intercept'] - self.log_offset) / xzero_deceased_count), 0)
-
-        # positive = np.array(np.exp(self.t_vals * params['positive_slope'])) * params['positive_intercept']
-        # deceased = np.array(np.exp(self.t_vals * params['deceased_slope'])) * params['deceased_intercept']
-
-        # for i in range(len(positive)):
-        #     if i % 7 == 0:
-        #         positive[i] *= params['day0_multiplier']
-        #         deceased[i] *= params['day0_multiplier']
-        #     if i % 7 == 1:
-        #         positive[i] *= params['day1_multiplier']
-        #         deceased[i] *= params['day1_multiplier']
-        #     if i % 7 == 2:
-        #         positive[i] *= params['day2_multiplier']
-        #         deceased[i] *= params['day2_multiplier']
-        #     if i % 7 == 3:
-        #         positive[i] *= params['day3_multiplier']
-        #         deceased[i] *= params['day3_multiplier']
-        #     if i % 7 == 4:
-        #         positive[i] *= params['day4_multiplier']
-        #         deceased[i] *= params['day4_multiplier']
-        #     if i % 7 == 5:
-        #         positive[i] *= params['day5_multiplier']
-        #         deceased[i] *= params['day5_multiplier']
-        #     if i % 7 == 6:
-        #         positive[i] *= params['day6_multiplier']
-        #         deceased[i] *= params['day6_multiplier']
-
-        for i in range(len(positive)):
-            if i % 7 == 0:
-                positive[i] *= params['day0_positive_multiplier']
-                deceased[i] *= params['day0_deceased_multiplier']
-            if i % 7 == 1:
-                positive[i] *= params['day1_positive_multiplier']
-                deceased[i] *= params['day1_deceased_multiplier']
-            if i % 7 == 2:
-                positive[i] *= params['day2_positive_multiplier']
-                deceased[i] *= params['day2_deceased_multiplier']
-            if i % 7 == 3:
-                positive[i] *= params['day3_positive_multiplier']
-                deceased[i] *= params['day3_deceased_multiplier']
-            if i % 7 == 4:
-                positive[i] *= params['day4_positive_multiplier']
-                deceased[i] *= params['day4_deceased_multiplier']
-            if i % 7 == 5:
-                positive[i] *= params['day5_positive_multiplier']
-                deceased[i] *= params['day5_deceased_multiplier']
-            if i % 7 == 6:
-                positive[i] *= params['day6_positive_multiplier']
-                deceased[i] *= params['day6_deceased_multiplier']
+        if self.opt_numba:
+            positive, deceased = compiled_kernels.moving_window_trajectories(
+                np.asarray(t_vals, dtype=float), day_of_week_inds, slopes, intercepts, day_of_week_multipliers,
+                float(intercept_t_val), float(self.log_offset))
+        else:
+            xzero_counts = np.exp(intercept_t_val * slopes)
+            positive, deceased = np.maximum(np.exp(np.outer(slopes, t_vals)) *
+                                            ((intercepts - self.log_offset) / xzero_counts)[:, np.newaxis], 0) * \
+                                 day_of_week_multipliers[:, day_of_week_inds]
 
         return np.vstack([np.squeeze(contagious), positive[:contagious.size], deceased[:contagious.size]])
 
+    def run_simulation_batch(self, param_matrix, sol_indices=None):
+        '''
+        Vectorized run_simulation: all trajectories in one broadcast against the day-of-week index
+        :param param_matrix: (N, n_params) array in sorted_names order, or a list of parameter lists or dictionaries
+        :param sol_indices: which points of t_vals to simulate, defaults to all of them
+        :return: (N, 3, T) numpy array, the contagious rows are NaN since they don't matter for MovingWindowModel
+        '''
+        full_matrix = self.param_layout.get_full_matrix(self._get_param_matrix(param_matrix))
+
+        if sol_indices is None:
+            t_vals = self.t_vals
+            day_of_week_inds = self.day_of_week_inds
+        else:
+            sol_indices = np.asarray(sol_indices, dtype=int)
+            t_vals = self.t_vals[sol_indices]
+            day_of_week_inds = self.day_of_week_inds[sol_indices]
+
+        # axis 1 is positive, deceased
+        slopes = full_matrix[:, self.slope_slots, np.newaxis]
+        intercepts = full_matrix[:, self.intercept_slots, np.newaxis]
+        day_of_week_multipliers = full_matrix[:, self.day_of_week_multiplier_slots]
+
+        # do intercept at the beginning of moving window
+        intercept_t_val = self.max_date_in_days - self.moving_window_size
+        sols = np.full((len(full_matrix), 3, len(t_vals)), np.nan)
+        sols[:, 1:, :] = np.maximum(np.exp(slopes * t_vals) *
+                                    ((intercepts - self.log_offset) / np.exp(intercept_t_val * slopes)), 0) * \
+                         day_of_week_multipliers[:, :, day_of_week_inds]
+        return sols
+
     def _get_log_likelihood_precursor(self,
                                       in_params,
                                       data_new_tested=None,
@@ -137,43 +145,284 @@ class MovingWindowModel(BayesModel):
         :param deaths_bootstrap_indices:  bootstrap indices when applicable
         :param cases_bootstrap_indices: which indices to include in the likelihood?
         :param deaths_bootstrap_indices: which indices to include in the likelihood?
-        :return: tuple of lists: distances, other errors, and simulated solution
+        :return: tuple of numpy arrays: distances, other errors, and simulated solution (at the cases indices, then
+                 the deaths indices)
         '''
 
-        # convert from list to dictionary (for compatibility with the least-sq solver
-        params = self.convert_params_as_list_to_dict(in_params)
+        # full parameter vector, static params included (lists come from the least-sq solver)
+        params = self.param_layout.get_full_vector(in_params)
+
+        if cases_bootstrap_indices is None:
+            cases_bootstrap_indices = self.cases_indices[-self.moving_window_size:]
+        if deaths_bootstrap_indices is None:
+            deaths_bootstrap_indices = self.deaths_indices[-self.moving_window_size:]
+        cases_bootstrap_indices = np.asarray(cases_bootstrap_indices, dtype=int)
+        deaths_bootstrap_indices = np.asarray(deaths_bootstrap_indices, dtype=int)
+
+        actual_tested = self._get_log_actual(data_new_tested, cases_bootstrap_indices, 'tested')
+        actual_dead = self._get_log_actual(data_new_dead, deaths_bootstrap_indices, 'dead')
 
         if data_new_tested is None:
             data_new_tested = self.data_new_tested
         if data_new_dead is None:
             data_new_dead = self.data_new_dead
 
+        # only simulate the days the likelihood looks at
+        n_cases = len(cases_bootstrap_indices)
+        sol = self.run_simulation(params, sol_indices=np.concatenate([cases_bootstrap_indices,
+                                                                      deaths_bootstrap_indices]) + self.burn_in)
+        # NB: sol is an object array since the contagious row is all None
+        new_tested_from_sol = sol[1, :n_cases].astype(np.float64)
+        new_deceased_from_sol = sol[2, n_cases:].astype(np.float64)
+
+        predicted_tested = np.log(new_tested_from_sol + self.log_offset)
+        predicted_dead = np.log(new_deceased_from_sol + self.log_offset)
+
+        new_tested_dists = predicted_tested - actual_tested
+        new_dead_dists = predicted_dead - actual_dead
+
+        tested_vals = np.asarray(data_new_tested)[cases_bootstrap_indices]
+        deceased_vals = np.asarray(data_new_dead)[deaths_bootstrap_indices]
+        other_errs = np.zeros(0)
+
+        return new_tested_dists, new_dead_dists, other_errs, sol, tested_vals, deceased_vals, \
+               predicted_tested, actual_tested, predicted_dead, actual_dead
+
+    def _get_log_likelihood_precursor_batch(self,
+                                            param_matrix,
+                                            data_new_tested=None,
+                                            data_new_dead=None,
+                                            cases_bootstrap_indices=None,
+                                            deaths_bootstrap_indices=None):
+        '''
+        Vectorized _get_log_likelihood_precursor: simulates only the fitted indices, for every row of the parameter
+          matrix at once
+        :param param_matrix: (N, n_params) array
+        :return: tuple of (N, n_cases) distances, (N, n_deaths) distances, (N, 0) other errors
+        '''
+        if cases_bootstrap_indices is None:
+            cases_bootstrap_indices = self.cases_indices[-self.moving_window_size:]
+        if deaths_bootstrap_indices is None:
+            deaths_bootstrap_indices = self.deaths_indices[-self.moving_window_size:]
+        cases_bootstrap_indices = np.asarray(cases_bootstrap_indices, dtype=int)
+        deaths_bootstrap_indices = np.asarray(deaths_bootstrap_indices, dtype=int)
+
+        actual_tested = self._get_log_actual(data_new_tested, cases_bootstrap_indices, 'tested')
+        actual_dead = self._get_log_actual(data_new_dead, deaths_bootstrap_indices, 'dead')
+
+        n_cases = len(cases_bootstrap_indices)
+        sols = self.run_simulation_batch(param_matrix,
+                                         sol_indices=np.concatenate([cases_bootstrap_indices,
+                                                                     deaths_bootstrap_indices]) + self.burn_in)
+        predicted_tested = np.log(sols[:, 1, :n_cases] + self.log_offset)
+        predicted_dead = np.log(sols[:, 2, n_cases:] + self.log_offset)
+
+        return predicted_tested - actual_tested, predicted_dead - actual_dead, np.zeros((len(param_matrix), 0))
+
+    def _jac_for_least_squares(self,
+                               in_params,
+                               data_new_tested=None,
+                               data_new_dead=None,
+                               cases_bootstrap_indices=None,
+                               deaths_bootstrap_indices=None,
+                               cases_bootstrap_weights=None,
+                               deaths_bootstrap_weights=None):
+        '''
+        Exact Jacobian of self._errfunc_for_least_squares, so scipy.optimize.least_squares can skip finite differences
+          Each residual is |log(predicted + log_offset) - log(actual + log_offset)| / sqrt(2), with
+          predicted = max((intercept - log_offset) * exp((t - t0) * slope), 0) * day-of-week multiplier,
+          so every partial derivative is a closed-form expression in predicted.
+        :param in_params: dictionary or list of parameters
+        :param cases_bootstrap_indices: which indices to include in the likelihood?
+        :param deaths_bootstrap_indices: which indices to include in the likelihood?
+        :param cases_bootstrap_weights: multiplicity of each of cases_bootstrap_indices, defaults to once each
+        :param deaths_bootstrap_weights: multiplicity of each of deaths_bootstrap_indices, defaults to once each
+        :return: (n_residuals, n_params) numpy array
+        '''
+        params = self.param_layout.get_full_vector(in_params)
+
         if cases_bootstrap_indices is None:
             cases_bootstrap_indices = self.cases_indices[-self.moving_window_size:]
         if deaths_bootstrap_indices is None:
             deaths_bootstrap_indices = self.deaths_indices[-self.moving_window_size:]
+        cases_bootstrap_indices = np.asarray(cases_bootstrap_indices, dtype=int)
+        deaths_bootstrap_indices = np.asarray(deaths_bootstrap_indices, dtype=int)
 
-        # timer = Stopwatch()
-        sol = self.run_simulation(params)
-        new_tested_from_sol = sol[1]
-        new_deceased_from_sol = sol[2]
-        # print(f'Simulation took {timer.elapsed_time() * 100} ms')
-        # timer = Stopwatch()
+        actual_tested = self._get_log_actual(data_new_tested, cases_bootstrap_indices, 'tested')
+        actual_dead = self._get_log_actual(data_new_dead, deaths_bootstrap_indices, 'dead')
 
-        actual_tested = [np.log(data_new_tested[i] + self.log_offset) for i in cases_bootstrap_indices]
-        predicted_tested = [np.log(new_tested_from_sol[i + self.burn_in] + self.log_offset) for i in cases_bootstrap_indices]
-        actual_dead = [np.log(data_new_dead[i] + self.log_offset) for i in deaths_bootstrap_indices]
-        predicted_dead = [np.log(new_deceased_from_sol[i + self.burn_in] + self.log_offset) for i in deaths_bootstrap_indices]
+        # do intercept at the beginning of moving window
+        intercept_t_val = self.max_date_in_days - self.moving_window_size
 
-        new_tested_dists = [predicted_tested[i] - actual_tested[i] for i in range(len(predicted_tested))]
-        new_dead_dists = [predicted_dead[i] - actual_dead[i] for i in range(len(predicted_dead))]
+        jacs = list()
+        for row, indices, actual, weights in ((0, cases_bootstrap_indices, actual_tested, cases_bootstrap_weights),
+                                              (1, deaths_bootstrap_indices, actual_dead, deaths_bootstrap_weights)):
+            slope = params[self.slope_slots[row]]
+            intercept = params[self.intercept_slots[row]]
+
+            sol_indices = indices + self.burn_in
+            t_vals = self.t_vals[sol_indices]
+            growth = np.exp(t_vals * slope) / np.exp(intercept_t_val * slope)
+            trend = np.maximum(growth * (intercept - self.log_offset), 0)
+            day_of_week_slots = self.day_of_week_multiplier_slots[row][self.day_of_week_inds[sol_indices]]
+            multiplier = params[day_of_week_slots]
+            predicted = trend * multiplier
+            dists = np.log(predicted + self.log_offset) - actual
+
+            # d(residual) / d(predicted), zero wherever the trend is clipped at zero
+            scale = np.sign(dists) / np.sqrt(2) / (predicted + self.log_offset) * (trend > 0)
+            if weights is not None:
+                scale = scale * np.sqrt(weights)
+
+            jac = np.zeros((len(indices), len(self.param_layout)))
+            jac[:, self.slope_slots[row]] = scale * (t_vals - intercept_t_val) * predicted
+            jac[:, self.intercept_slots[row]] = scale * growth * multiplier
+            jac[np.arange(len(indices)), day_of_week_slots] = scale * trend
+            jacs.append(jac)
+
+        # static params sit after the fitted ones in the layout, and there are no other_errs for this model
+        return np.vstack(jacs)[:, :self.param_layout.n_fit]
+
+    @staticmethod
+    def _solve_normal_equations(normal_matrices, normal_rhs):
+        '''
+        Solve a stack of (possibly singular) normal equations, with just enough ridge that directions without any data
+        get a zero step
+        :param normal_matrices: (N, p, p) numpy array
+        :param normal_rhs: (N, p) numpy array
+        :return: (N, p) numpy array
+        '''
+        ridge = 1e-10 * np.max(np.abs(np.diagonal(normal_matrices, axis1=1, axis2=2)), axis=1, initial=1e-300)
+        return np.linalg.solve(normal_matrices + ridge[:, np.newaxis, np.newaxis] * np.eye(normal_matrices.shape[1]),
+                               normal_rhs[:, :, np.newaxis])[:, :, 0]
 
-        tested_vals = [data_new_tested[i] for i in cases_bootstrap_indices]
-        deceased_vals = [data_new_dead[i] for i in deaths_bootstrap_indices]
-        other_errs = list()
+    def _fit_bootstrap_replicates_closed_form(self, bootstrap_inds, max_refinement_steps=20):
+        '''
+        Batched bootstrap fits for all replicates at once, instead of one nonlinear least-squares solve per replicate
+          With the sigmas fixed, each curve is a linear regression in log space:
+          log(predicted) = log(intercept - log_offset) + (t - t0) * slope + log(day-of-week multiplier),
+          so every replicate starts from a weighted least-squares solve (its bootstrap counts are the weights), all of
+          them through one stacked set of normal equations. That's the same regression as render_statsmodels_fit, which
+          leaves out the log_offset in log(predicted + log_offset), so it's followed by stacked Gauss-Newton steps on
+          the actual residuals, which only take more than a step or two where the counts are comparable to log_offset.
+          Replicates that still haven't converged after max_refinement_steps (e.g. a deaths curve that's nearly all
+          zeros, where the best fit is clipped to zero), or that ended up outside curve_fit_bounds, are flagged for the
+          one-by-one fit.
+          Coefficients a replicate can't pin down (e.g. a weekday it didn't draw) stay at the all-data values.
+        :param bootstrap_inds: which replicates (see _get_bootstrap_counts)
+        :param max_refinement_steps: Gauss-Newton steps before giving up on a replicate
+        :return: tuple of list of parameter dictionaries (one per replicate), numpy bool array of unconverged replicates
+        '''
+        all_cases_counts, all_deaths_counts = self._get_bootstrap_counts(bootstrap_inds)
+        opt_unconverged = np.zeros(len(bootstrap_inds), dtype=bool)
+        n_fit = self.param_layout.n_fit
+        starting_point = self.param_layout.get_full_vector([self.all_data_params[key] for key in self.sorted_names])
+        param_matrix = np.tile(starting_point[:n_fit], (len(all_cases_counts), 1))
 
-        return new_tested_dists, new_dead_dists, other_errs, sol, tested_vals, deceased_vals, \
-               predicted_tested, actual_tested, predicted_dead, actual_dead
+        # do intercept at the beginning of moving window
+        intercept_t_val = self.max_date_in_days - self.moving_window_size
+
+        for row, indices, which, counts in ((0, self.cases_indices, 'tested', all_cases_counts),
+                                            (1, self.deaths_indices, 'dead', all_deaths_counts)):
+            indices = np.asarray(indices, dtype=int)
+            sol_indices = indices + self.burn_in
+            day_of_week_slots = self.day_of_week_multiplier_slots[row][self.day_of_week_inds[sol_indices]]
+            fitted_day_of_week_slots = sorted(set(day_of_week_slots[day_of_week_slots < n_fit]))
+            fit_slots = np.array([self.intercept_slots[row], self.slope_slots[row]] + fitted_day_of_week_slots)
+
+            # columns are log(intercept - log_offset), slope, then one dummy per fitted day-of-week multiplier
+            design = np.zeros((len(indices), len(fit_slots)))
+            design[:, 0] = 1
+            design[:, 1] = self.t_vals[sol_indices] - intercept_t_val
+            for col, slot in enumerate(fitted_day_of_week_slots, 2):
+                design[:, col] = day_of_week_slots == slot
+
+            # static multipliers (i.e. day 0) just shift log(predicted)
+            log_static_multipliers = np.zeros(len(indices))
+            opt_static = day_of_week_slots >= n_fit
+            log_static_multipliers[opt_static] = np.log(starting_point[day_of_week_slots[opt_static]])
+            log_actual = self._get_log_actual(None, indices, which)
+
+            # solve for the step away from the all-data fit, so directions without data don't move
+            starting_coefs = np.concatenate([[np.log(max(starting_point[fit_slots[0]] - self.log_offset, 1e-300)),
+                                              starting_point[fit_slots[1]]],
+                                             np.log(starting_point[fit_slots[2:]])])
+            residuals = log_actual - log_static_multipliers - design @ starting_coefs
+            n_coefs = len(fit_slots)
+            coefs = starting_coefs + self._solve_normal_equations(
+                (counts @ (design[:, :, np.newaxis] * design[:, np.newaxis, :]).reshape(-1, n_coefs ** 2)).reshape(
+                    -1, n_coefs, n_coefs),
+                counts @ (design * residuals[:, np.newaxis]))
+
+            def get_dists_and_costs(coefs, counts):
+                predicted = np.exp(coefs @ design.T + log_static_multipliers)
+                dists = np.log(predicted + self.log_offset) - log_actual
+                return predicted, dists, np.sum(counts * dists ** 2, axis=1)
+
+            # Gauss-Newton with step halving, on the replicates that are still improving
+            predicted, dists, costs = get_dists_and_costs(coefs, counts)
+            active = np.arange(len(coefs))
+            for _ in range(max_refinement_steps):
+                jacs = (predicted / (predicted + self.log_offset))[:, :, np.newaxis] * design
+                weighted_jacs = np.swapaxes(counts[active, :, np.newaxis] * jacs, 1, 2)
+                steps = -self._solve_normal_equations(weighted_jacs @ jacs,
+                                                      (weighted_jacs @ dists[:, :, np.newaxis])[:, :, 0])
+                step_sizes = np.ones(len(active))
+                for _ in range(20):
+                    trial_predicted, trial_dists, trial_costs = get_dists_and_costs(
+                        coefs[active] + step_sizes[:, np.newaxis] * steps, counts[active])
+                    opt_better = trial_costs <= costs[active]
+                    if np.all(opt_better):
+                        break
+                    step_sizes[~opt_better] /= 2
+
+                opt_improving = opt_better & (trial_costs < costs[active] * (1 - 1e-12))
+                coefs[active[opt_better]] += step_sizes[opt_better, np.newaxis] * steps[opt_better]
+                costs[active[opt_better]] = trial_costs[opt_better]
+                active, predicted, dists = active[opt_improving], trial_predicted[opt_improving], \
+                                           trial_dists[opt_improving]
+                if len(active) == 0:
+                    break
+            opt_unconverged[active] = True
+
+            param_matrix[:, fit_slots[0]] = np.exp(coefs[:, 0]) + self.log_offset
+            param_matrix[:, fit_slots[1]] = coefs[:, 1]
+            param_matrix[:, fit_slots[2:]] = np.exp(coefs[:, 2:])
+
+        # the solves above ignore the box the least-squares fits are bounded to, and clipping a replicate back into it
+        #   isn't the bounded optimum, so anything that left the box goes to the one-by-one fit as well
+        lower_bounds = np.array([self.curve_fit_bounds[name][0] for name in self.sorted_names])
+        upper_bounds = np.array([self.curve_fit_bounds[name][1] for name in self.sorted_names])
+        opt_unconverged |= np.any((param_matrix < lower_bounds) | (param_matrix > upper_bounds), axis=1)
+        param_matrix = np.clip(param_matrix, lower_bounds, upper_bounds)
+        return [dict(zip(self.sorted_names, params)) for params in param_matrix], opt_unconverged
+
+    def _get_bootstrap_store_header(self):
+        header = super(MovingWindowModel, self)._get_bootstrap_store_header()
+        header['opt_closed_form_bootstraps'] = self.opt_closed_form_bootstraps
+        return header
+
+    def _fit_bootstrap_replicates_in_parallel(self, bootstrap_inds):
+        '''
+        Bootstrap fits via _fit_bootstrap_replicates_closed_form, which take less time than starting up worker processes
+          would. Only the replicates it couldn't converge go out for one-by-one fits on n_bootstrap_jobs workers.
+          Set opt_closed_form_bootstraps=False for one-by-one fits throughout.
+        :param bootstrap_inds: which replicates
+        :return: list of parameter dictionaries in bootstrap_inds order
+        '''
+        if not self.opt_closed_form_bootstraps:
+            return super(MovingWindowModel, self)._fit_bootstrap_replicates_in_parallel(bootstrap_inds)
+
+        bootstrap_inds = list(bootstrap_inds)
+        bootstrap_params, opt_unconverged = self._fit_bootstrap_replicates_closed_form(bootstrap_inds)
+        if np.any(opt_unconverged):
+            print(f'{np.sum(opt_unconverged)} of {len(bootstrap_inds)} bootstraps need the one-by-one fit...')
+            unconverged_inds = np.flatnonzero(opt_unconverged)
+            unconverged_params = super(MovingWindowModel, self)._fit_bootstrap_replicates_in_parallel(
+                [bootstrap_inds[i] for i in unconverged_inds])
+            for i, params in zip(unconverged_inds, unconverged_params):
+                bootstrap_params[i] = params
+        return bootstrap_params
 
     def render_statsmodels_fit(self, opt_simplified=False):
         '''
@@ -372,7 +621,7 @@ class MovingWindowModel(BayesModel):
                 all_dict[name] = np.exp(all_dict[name])
             weight_sampled_params.append(self.convert_params_as_dict_to_list(all_dict.copy()))
 
-        log_probs = [self.get_log_likelihood(x) for x in weight_sampled_params]
+        log_probs = self.get_log_likelihood_batch(weight_sampled_params)
 
         return weight_sampled_params, weight_sampled_params, [1] * len(weight_sampled_params), log_probs
 
@@ -528,7 +777,7 @@ class MovingWindowModel(BayesModel):
 
             all_PyMC3_samples_as_list = [self.convert_params_as_dict_to_list(tmp_dict) for tmp_dict in
                                          trace_as_list_of_dicts]
-            all_PyMC3_log_probs_as_list = [self.get_log_likelihood(params) for params in trace_as_list_of_dicts]
+            all_PyMC3_log_probs_as_list = list(self.get_log_likelihood_batch(trace_as_list_of_dicts))
 
             tmp_dict = {'all_PyMC3_samples_as_list': all_PyMC3_samples_as_list,
                         'all_PyMC3_log_probs_as_list': all_PyMC3_log_probs_as_list}
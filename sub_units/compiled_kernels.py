@@ -0,0 +1,120 @@
+import numpy as np
+
+# Numba is optional: without it these are plain Python loops and the models stick to their NumPy code paths
+try:
+    import numba
+
+    opt_numba_available = True
+except:
+    numba = None
+    opt_numba_available = False
+
+
+def _jit(func):
+    if numba is None:
+        return func
+    return numba.njit(cache=True)(func)
+
+
+@_jit
+def moving_window_trajectories(t_vals,
+                               day_of_week_inds,
+                               slopes,
+                               intercepts,
+                               day_of_week_multipliers,
+                               intercept_t_val,
+                               log_offset):
+    '''
+    MovingWindowModel trajectories: max((intercept - log_offset) * exp((t - t0) * slope), 0) * day-of-week multiplier
+    :param t_vals: numpy array of times to simulate
+    :param day_of_week_inds: day of the week (0-6) of each of t_vals
+    :param slopes: positive, deceased slopes
+    :param intercepts: positive, deceased intercepts
+    :param day_of_week_multipliers: (2, 7) numpy array
+    :param intercept_t_val: time of the intercept (beginning of the moving window)
+    :param log_offset: offset that was added to the data before taking logs
+    :return: (2, len(t_vals)) numpy array of positive, deceased
+    '''
+    sols = np.empty((2, len(t_vals)))
+    for row in range(2):
+        scale = (intercepts[row] - log_offset) / np.exp(intercept_t_val * slopes[row])
+        for i in range(len(t_vals)):
+            val = np.exp(t_vals[i] * slopes[row]) * scale
+            if val < 0:
+                val = 0.
+            sols[row, i] = val * day_of_week_multipliers[row, day_of_week_inds[i]]
+    return sols
+
+
+@_jit
+def _convolve_contagious_into(sols, row, start, kernel, mult):
+    '''
+    sols[row] = max(mult * (sols[0] convolved with a kernel that is zero before day start), 0)
+    '''
+    for i in range(start, sols.shape[1]):
+        total = 0.
+        for k in range(min(len(kernel), i - start + 1)):
+            total += kernel[k] * sols[0, i - start - k]
+        sols[row, i] = max(total * mult, 0.)
+
+
+@_jit
+def convolution_trajectories(elapsed_t_vals,
+                             integrated_sigmoid,
+                             I_0,
+                             alpha_1,
+                             alpha_2,
+                             positive_start,
+                             positive_kernel,
+                             positive_mult,
+                             deceased_start,
+                             deceased_kernel,
+                             deceased_mult,
+                             n_days):
+    '''
+    ConvolutionModel trajectories: closed-form contagious curve, then direct convolution with truncated kernels
+    :param elapsed_t_vals: t_vals - t_vals[0]
+    :param integrated_sigmoid: integral of the growth-rate sigmoid from t_vals[0] to each t_val
+    :param positive_start: first day of the truncated contagious -> positive kernel
+    :param positive_kernel: numpy array of kernel weights from positive_start on
+    :param deceased_start: first day of the truncated contagious -> deceased kernel
+    :param deceased_kernel: numpy array of kernel weights from deceased_start on
+    :param n_days: how many t_vals to simulate
+    :return: (3, n_days) numpy array of contagious, positive, deceased
+    '''
+    sols = np.zeros((3, n_days))
+    for i in range(n_days):
+        sols[0, i] = I_0 * np.exp(alpha_1 * elapsed_t_vals[i] + (alpha_2 - alpha_1) * integrated_sigmoid[i])
+
+    _convolve_contagious_into(sols, 1, positive_start, positive_kernel, positive_mult)
+    _convolve_contagious_into(sols, 2, deceased_start, deceased_kernel, deceased_mult)
+
+    for i in range(n_days):
+        sols[0, i] = max(sols[0, i], 0.)
+    return sols
+
+
+@_jit
+def gaussian_log_likelihood(dists, sigma):
+    '''
+    sum of -dist ** 2 / (2 * sigma ** 2) + log(1 / sigma) over dists
+    :return: float
+    '''
+    total = 0.
+    for i in range(len(dists)):
+        total += dists[i] * dists[i]
+    return -total / (2 * sigma ** 2) - len(dists) * np.log(sigma)
+
+
+@_jit
+def weighted_gaussian_log_likelihood(dists, weights, sigma):
+    '''
+    gaussian_log_likelihood where point i counts weights[i] times
+    :return: float
+    '''
+    total = 0.
+    n_points = 0.
+    for i in range(len(dists)):
+        total += weights[i] * dists[i] * dists[i]
+        n_points += weights[i]
+    return -total / (2 * sigma ** 2) - n_points * np.log(sigma)
@@ -0,0 +1,143 @@
+import os
+import json
+import gzip
+import hashlib
+import shutil
+import requests
+
+
+def _get_metadata_filename(filename):
+    return filename + '.fetch.json'
+
+
+def _load_metadata(filename):
+    try:
+        with open(_get_metadata_filename(filename), 'r') as f:
+            return json.load(f)
+    except:
+        return dict()
+
+
+def _save_metadata(filename, metadata):
+    metadata_filename = _get_metadata_filename(filename)
+    with open(metadata_filename + '.tmp', 'w') as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(metadata_filename + '.tmp', metadata_filename)
+
+
+def _get_sha1(filename, block_size=2 ** 20):
+    file_hash = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def fetch_if_changed(url,
+                     filename,
+                     timeout=60,
+                     chunk_size=2 ** 16,
+                     opt_force=False):
+    '''
+    Download url to filename, but only if upstream has changed since our last fetch
+      Sends If-None-Match / If-Modified-Since from the last response, asks for a gzip-compressed transfer, and streams
+      the raw bytes to filename + '.part'. An interrupted download resumes from the end of the .part file (with
+      If-Range, so it starts over if upstream changed in the meantime). The new content only replaces filename once
+      it's complete, with an atomic os.replace, so readers never see a half-written file.
+    :param url: source URL
+    :param filename: local destination
+    :param timeout: seconds to wait on the server before giving up
+    :param chunk_size: bytes per read while streaming
+    :param opt_force: ignore the cached validators and download anyway
+    :return: True if filename now has different content than before, False otherwise
+    '''
+    metadata = _load_metadata(filename)
+    part_filename = filename + '.part'
+
+    headers = {'Accept-Encoding': 'gzip'}
+    if not opt_force and os.path.exists(filename) and metadata.get('url') == url:
+        if metadata.get('etag') is not None:
+            headers['If-None-Match'] = metadata['etag']
+        if metadata.get('last_modified') is not None:
+            headers['If-Modified-Since'] = metadata['last_modified']
+
+    # resume a partial download, as long as it's for the same upstream version
+    partial = metadata.get('partial')
+    part_size = os.path.getsize(part_filename) if os.path.exists(part_filename) else 0
+    if partial is not None and partial.get('url') == url and partial.get('etag') is not None and part_size > 0:
+        headers['Range'] = f'bytes={part_size}-'
+        headers['If-Range'] = partial['etag']
+
+    print(f'Fetching {url}...')
+    with requests.get(url, headers=headers, stream=True, timeout=timeout) as r:
+        if r.status_code == 304:
+            print('...not modified upstream')
+            return False
+        r.raise_for_status()
+
+        if r.status_code == 206:
+            print(f'...resuming after {part_size:,} bytes')
+            content_encoding = partial.get('content_encoding')
+            mode = 'ab'
+        else:
+            content_encoding = r.headers.get('Content-Encoding')
+            mode = 'wb'
+
+        # remember what we're downloading before we start, so an interrupted transfer can pick up where it stopped
+        metadata['partial'] = {'url': url,
+                               'etag': r.headers.get('ETag'),
+                               'last_modified': r.headers.get('Last-Modified'),
+                               'content_encoding': content_encoding}
+        _save_metadata(filename, metadata)
+
+        with open(part_filename, mode) as f:
+            for chunk in r.raw.stream(chunk_size, decode_content=False):
+                f.write(chunk)
+
+    partial = metadata.pop('partial')
+    tmp_filename = filename + '.tmp'
+    if partial['content_encoding'] == 'gzip':
+        with gzip.open(part_filename, 'rb') as f_in, open(tmp_filename, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(part_filename)
+    elif partial['content_encoding'] in (None, 'identity'):
+        os.replace(part_filename, tmp_filename)
+    else:
+        os.remove(part_filename)
+        raise ValueError(f'Unsupported Content-Encoding from {url}: {partial["content_encoding"]}')
+
+    sha1 = _get_sha1(tmp_filename)
+    opt_changed = sha1 != metadata.get('sha1') or not os.path.exists(filename)
+    if opt_changed:
+        os.replace(tmp_filename, filename)
+        print(f'...updated {filename}')
+    else:
+        os.remove(tmp_filename)
+        print('...same content as before')
+
+    metadata.update({'url': url,
+                     'etag': partial['etag'],
+                     'last_modified': partial['last_modified'],
+                     'sha1': sha1})
+    _save_metadata(filename, metadata)
+    return opt_changed
+
+
+def is_processed(filename):
+    '''
+    Has the current content of filename already been through a run that finished (see mark_processed)?
+      Whether the last fetch downloaded anything isn't enough, since a run that crashed after the fetch would leave
+      that day's data unprocessed with nothing new upstream to trigger a retry.
+    :return: boolean
+    '''
+    processed_sha1 = _load_metadata(filename).get('processed_sha1')
+    return processed_sha1 is not None and os.path.exists(filename) and _get_sha1(filename) == processed_sha1
+
+
+def mark_processed(filename):
+    '''
+    Record the current content of filename as processed, call once everything downstream of it has finished
+    '''
+    metadata = _load_metadata(filename)
+    metadata['processed_sha1'] = _get_sha1(filename)
+    _save_metadata(filename, metadata)
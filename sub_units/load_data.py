@@ -2,134 +2,895 @@ import pandas as pd
 import numpy as np
 import os
 import datetime
+import hashlib
+import io
+import joblib
+import pickle
+from enum import Enum
+from scipy.signal import lfilter
 
 data_dir = 'source_data'
+count_cube_dir = 'count_cubes'
 
-# NB: full_count_data is cumulative
-full_count_data = pd.read_csv(os.path.join(data_dir, 'counts.csv'))
-# from https://github.com/nytimes/covid-19-data
-# curl https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-states.csv
-full_count_data['date'] = full_count_data['date'].astype('datetime64[ns]')
-
-date_range = pd.date_range(min(full_count_data['date']), max(full_count_data['date']))
-map_state_to_series = dict()
-
-# get totals across U.S.
-list_of_dict_totals = list()
-for date in sorted(set(full_count_data['date'])):
-    date_iloc = [i for i, x in enumerate(full_count_data['date']) if x == date]
-    sum_cases = sum(full_count_data.iloc[date_iloc]['cases'])
-    sum_deaths = sum(full_count_data.iloc[date_iloc]['deaths'])
-    list_of_dict_totals.append({'date': date, 'cases': sum_cases, 'deaths': sum_deaths, 'state': 'total'})
-
-total_counts_data = pd.DataFrame(list_of_dict_totals)
-full_count_data = full_count_data.append(total_counts_data, ignore_index=True)
-
-# data munging gets daily-differences differences by state
-for state in sorted(set(full_count_data['state'])):
-    state_iloc = [i for i, x in enumerate(full_count_data['state']) if x == state]
-    state_iloc = sorted(state_iloc, key=lambda x: full_count_data.iloc[x]['date'])
-
-    cases_series = pd.Series({full_count_data.iloc[i]['date']: full_count_data.iloc[i]['cases'] for i in state_iloc})
-    deaths_series = pd.Series({full_count_data.iloc[i]['date']: full_count_data.iloc[i]['deaths'] for i in state_iloc})
-
-    cases_series.index = pd.DatetimeIndex(cases_series.index)
-    deaths_series.index = pd.DatetimeIndex(deaths_series.index)
-
-    cases_diff = cases_series.diff()
-    deaths_diff = deaths_series.diff()
-
-    map_state_to_series[state] = {'cases_series': cases_series,
-                                  'deaths_series': deaths_series,
-                                  'cases_diff': cases_diff,
-                                  'deaths_diff': deaths_diff}
-
-# get state populations from https://www.census.gov/data/datasets/time-series/demo/popest/2010s-state-detail.html
-state_populations = pd.read_csv(os.path.join(data_dir, 'state_population.csv'))
-map_state_to_population = {
-    state_populations.iloc[i]['state']: int(state_populations.iloc[i]['population'].replace(',', '')) for i in
-    range(len(state_populations))}
-map_state_to_population['total'] = sum(map_state_to_population.values())
-
-# get shelter-in-place dates
-SIP_dates = pd.read_csv(
-    os.path.join(data_dir,
-                 'shelter_in_place_dates_by_state.csv'))  # from https://www.finra.org/rules-guidance/key-topics/covid-19/shelter-in-place
-SIP_dates['sip_date'] = SIP_dates['sip_date'].astype('datetime64[ns]')
-SIP_dates = SIP_dates.append(
-    pd.DataFrame([{'state': 'total', 'sip_date': datetime.datetime.strptime('2020-03-20', '%Y-%m-%d')}]))
-
-for i in range(len(SIP_dates)):
-    state = SIP_dates.iloc[i]['state']
-    SIP_date = SIP_dates.iloc[i]['sip_date']
-    map_state_to_series[state]['sip_date'] = SIP_date
+# layout of the last axis of the count cube
+CUBE_CASES = 0
+CUBE_DEATHS = 1
 
+# bump when the cube or its index changes layout, so stale caches are rebuilt instead of misread
+count_cube_version = 2
 
-def get_state_data(state,
-                   opt_smoothing=False):
-    # tmp = datetime.datetime.strptime('2020-01-21', '%Y-%m-%d')
-    # tmp2 = datetime.datetime.strptime('2020-03-19', '%Y-%m-%d')
-    # tmp2 - tmp = 58 days
-    # NP: Cali shelter-in-place (SIP) March 19 Data starts at Jan. 21.
-
-    population = map_state_to_population[state]
-    count_data = map_state_to_series[state]['cases_series'].values
-    n_count_data = np.prod(count_data.shape)
-    print(f'# data points: {n_count_data}')
-
-    min_date = min(list(map_state_to_series[state]['cases_series'].index))
-
-    # format count_data into I and S values for SIR Model
-    infected = [x for x in count_data]
-    susceptible = [population - x for x in count_data]
-    dead = [x for x in map_state_to_series[state]['deaths_series'].values]
-
-    ####
-    # Do three-day smoothing
-    ####
-
-    new_tested = [infected[0]] + [infected[i] - infected[i - 1] for i in
-                                  range(1, len(infected))]
-    new_dead = [dead[0]] + [dead[i] - dead[i - 1] for i in
-                            range(1, len(dead))]
-    
-    if opt_smoothing:
-        print('Smoothing the data...')
-        new_vals = [None] * len(new_tested)
-        for i in range(len(new_tested)):
-            new_vals[i] = sum(new_tested[slice(max(0, i - 1), min(len(new_tested), i + 2))]) / 3
-            # if new_vals[i] < 1 / 3:
-            #     new_vals[i] = 1 / 100  # minimum value
-        new_tested = new_vals.copy()
-        new_vals = [None] * len(new_dead)
-        for i in range(len(new_dead)):
-            new_vals[i] = sum(new_dead[slice(max(0, i - 1), min(len(new_dead), i + 2))]) / 3
-            # if new_vals[i] < 1 / 3:
-            #     new_vals[i] = 1 / 100  # minimum value
-        new_dead = new_vals.copy()
+# levels of the unit hierarchy, leaves first
+unit_levels_in_order = ['county', 'state', 'total']
+
+
+class SmoothingType(Enum):
+    __order__ = 'NONE CENTERED_3_DAY TRAILING_7_DAY EXPONENTIAL'
+    # second value goes into output filenames; matches the old opt_smoothing naming
+    NONE = ('none', '')
+    CENTERED_3_DAY = ('centered_3_day', 'smoothed_')
+    TRAILING_7_DAY = ('trailing_7_day', 'trailing_7_day_smoothed_')
+    EXPONENTIAL = ('exponential', 'exponentially_smoothed_')
+
+    def __str__(self):
+        return str(self.value)
+
+
+def get_smoothing_str(smoothing_type):
+    '''
+    Filename tag for a smoothing type (or for a custom smoothing function)
+    '''
+    if isinstance(smoothing_type, SmoothingType):
+        return smoothing_type.value[1]
+    return f'{smoothing_type.__name__}_smoothed_'
+
+
+def smooth_centered_3_day(new_counts):
+    '''
+    Centered three-day mean along the day axis, with zeros past either end
+    :param new_counts: (unit, day, 2) array of daily counts
+    :return: float array, same shape
+    '''
+    padded = np.pad(new_counts, ((0, 0), (1, 1), (0, 0)))
+    return (padded[:, :-2, :] + padded[:, 1:-1, :] + padded[:, 2:, :]) / 3
+
+
+def smooth_trailing(new_counts, window=7):
+    '''
+    Trailing mean over the last window days (including today), with zeros before the first day
+    :param new_counts: (unit, day, 2) array of daily counts
+    :param window: number of days to average
+    :return: float array, same shape
+    '''
+    cum_counts = np.cumsum(np.pad(new_counts, ((0, 0), (window, 0), (0, 0))), axis=1, dtype=np.float64)
+    return (cum_counts[:, window:, :] - cum_counts[:, :-window, :]) / window
+
+
+def smooth_exponential(new_counts, alpha=0.3):
+    '''
+    Exponentially-weighted moving average along the day axis: y[t] = alpha * x[t] + (1 - alpha) * y[t - 1]
+    :param new_counts: (unit, day, 2) array of daily counts
+    :param alpha: weight on the newest day
+    :return: float array, same shape
+    '''
+    return lfilter([alpha], [1, alpha - 1], np.asarray(new_counts, dtype=np.float64), axis=1)
+
+
+# any function from a (unit, day, 2) array to one of the same shape can be passed as a smoothing_type as well
+smoothing_kernels = {SmoothingType.CENTERED_3_DAY: smooth_centered_3_day,
+                     SmoothingType.TRAILING_7_DAY: smooth_trailing,
+                     SmoothingType.EXPONENTIAL: smooth_exponential}
+
+
+def get_file_hashes(filename, prefix_size=None, block_size=2 ** 20):
+    '''
+    Content hash of a file, read in blocks so big files don't need to fit in memory
+    :param filename: path to the file
+    :param prefix_size: if given, also return the hash of just the first prefix_size bytes (same pass over the file)
+    :return: tuple of hex digests as strings: (full-file hash, prefix hash or None)
+    '''
+    file_hash = hashlib.sha1()
+    prefix_hash = None
+    n_read = 0
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            if prefix_size is not None and prefix_hash is None and n_read + len(block) >= prefix_size:
+                tmp_hash = file_hash.copy()
+                tmp_hash.update(block[:prefix_size - n_read])
+                prefix_hash = tmp_hash.hexdigest()
+            file_hash.update(block)
+            n_read += len(block)
+    return file_hash.hexdigest(), prefix_hash
+
+
+def _forward_fill(count_cube, present, start_day=0):
+    '''
+    In-place forward-fill of the days a unit didn't report (zero before its first report), from start_day onward
+    :param count_cube: (unit, day, 2) array of cumulative counts
+    :param present: (unit, day) boolean mask of reported days
+    :param start_day: first day to fill; earlier days are assumed to be filled already
+    :return: None, modifies count_cube
+    '''
+    block_start = max(start_day - 1, 0)
+    block_present = present[:, block_start:].copy()
+    if start_day > 0:
+        block_present[:, 0] = True  # the day before start_day is already filled in, so it can seed the fill
+    last_present_day = np.where(block_present, np.arange(block_present.shape[1])[np.newaxis, :], -1)
+    np.maximum.accumulate(last_present_day, axis=1, out=last_present_day)
+    block = np.take_along_axis(count_cube[:, block_start:, :],
+                               np.maximum(last_present_day, 0)[:, :, np.newaxis], axis=1)
+    block[last_present_day < 0] = 0
+    count_cube[:, block_start:, :] = block
+
+
+def _fill_derived_counts(count_cube, new_counts, smoothed_new_counts, start_day=0):
+    '''
+    In-place daily differences and centered three-day smoothing of the count cube, from start_day onward
+      A changed cumulative count on day d only changes the differences from d on and the smoothing from d - 1 on,
+      so incremental updates only pay for the tail.
+    :param count_cube: (unit, day, 2) array of cumulative counts
+    :param new_counts: (unit, day, 2) int array of daily differences
+    :param smoothed_new_counts: (unit, day, 2) float array of smoothed daily differences
+    :param start_day: first day whose cumulative counts changed
+    :return: None, modifies new_counts and smoothed_new_counts
+    '''
+    if start_day == 0:
+        new_counts[:, 0, :] = count_cube[:, 0, :]
+    new_counts[:, max(start_day, 1):, :] = np.diff(count_cube[:, max(start_day - 1, 0):, :], axis=1)
+
+    # matches the truncated windows at the ends of each state's series since the cube is zero before a state's first
+    #   report and forward-filled (i.e. zero daily differences) after its last one
+    smooth_start = max(start_day - 1, 0)
+    if smooth_start == 0:
+        smoothed_new_counts[:, :, :] = smooth_centered_3_day(new_counts)
     else:
-        print('NOT smoothing the data...')
+        # the first day of the block is only there to be the left neighbor of smooth_start
+        smoothed_new_counts[:, smooth_start:, :] = smooth_centered_3_day(new_counts[:, smooth_start - 1:, :])[:, 1:, :]
+
+
+def _get_leaf_units(count_data):
+    '''
+    Name of the reporting unit of each row: the state, or "County, State" for NYT county-level data
+    :param count_data: dataframe with a state column, and a county column for county-level data
+    :return: tuple of numpy array of unit names, and whether the data is county-level
+    '''
+    if 'county' in count_data.columns:
+        return (count_data['county'].astype(str) + ', ' + count_data['state'].astype(str)).values, True
+    return count_data['state'].astype(str).values, False
+
+
+def validate_count_chunk(count_data, first_row=0):
+    '''
+    Check a chunk of the counts CSV against the date, state, fips, cases, deaths schema (plus county, if present)
+    :param count_data: dataframe as read from the CSV
+    :param first_row: row number of the chunk's first row in the file, for error messages
+    :return: dataframe with date parsed and cases/deaths as int64
+    '''
+    missing_columns = {'date', 'state', 'fips', 'cases', 'deaths'} - set(count_data.columns)
+    if len(missing_columns) > 0:
+        raise ValueError(f'Counts data is missing columns: {sorted(missing_columns)}')
+
+    def bad_rows(mask):
+        return ', '.join(str(first_row + x) for x in np.nonzero(np.asarray(mask))[0][:5])
+
+    count_data = count_data.copy()
+    count_data['date'] = pd.to_datetime(count_data['date'], format='%Y-%m-%d', errors='coerce')
+    if count_data['date'].isnull().any():
+        raise ValueError(f'Counts data has unparseable dates in rows {bad_rows(count_data["date"].isnull())}')
+    for col in ['state'] + (['county'] if 'county' in count_data.columns else []):
+        if count_data[col].isnull().any():
+            raise ValueError(f'Counts data is missing {col} in rows {bad_rows(count_data[col].isnull())}')
+    fips = pd.to_numeric(count_data['fips'], errors='coerce')
+    if (fips.isnull() & count_data['fips'].notnull()).any():
+        raise ValueError(f'Counts data has non-numeric fips in rows {bad_rows(fips.isnull() & count_data["fips"].notnull())}')
+    count_data['fips'] = fips
+    for col in ('cases', 'deaths'):
+        vals = pd.to_numeric(count_data[col], errors='coerce')
+        bad = vals.isnull() | (vals < 0) | (vals != np.floor(vals))
+        if bad.any():
+            raise ValueError(f'Counts data has missing, negative or fractional {col} in rows {bad_rows(bad)}')
+        count_data[col] = vals.astype(np.int64)
+    return count_data
+
+
+def read_count_chunks(counts_filename, chunksize=2 ** 16):
+    '''
+    Stream the counts CSV in validated chunks, so memory is bounded by the chunk size rather than the file size
+    :param counts_filename: path (or file-like object) of the counts CSV
+    :param chunksize: rows per chunk
+    :return: generator of dataframes
+    '''
+    first_row = 0
+    for chunk in pd.read_csv(counts_filename, chunksize=chunksize, dtype={'state': str, 'county': str}):
+        yield validate_count_chunk(chunk, first_row=first_row)
+        first_row += len(chunk)
 
-    infected = list(np.cumsum(new_tested))
-    dead = list(np.cumsum(new_dead))
-    
-    print('new_tested')
-    print(new_tested)
-    print('new_dead')
-    print(new_dead)
 
-    ####
-    # Put it all together
-    ####
+def _aggregate_units(count_cube, present, index, start_day=0):
+    '''
+    In-place sums of the leaf units up the hierarchy (counties to states to the U.S. total), from start_day onward
+      Children come before their parent and are contiguous, so each level is a single reduceat over the unit axis.
+    :param count_cube: (unit, day, 2) array of cumulative counts with the leaf units filled in
+    :param present: (unit, day) boolean mask of reported days
+    :param index: index dictionary with unit_levels and unit_parents
+    :param start_day: first day to aggregate; earlier days are assumed to be up to date
+    :return: None, modifies count_cube and present
+    '''
+    unit_levels = np.asarray(index['unit_levels'])
+    unit_parents = index['unit_parents']
+    for level in unit_levels_in_order[:-1]:
+        children = np.nonzero(unit_levels == level)[0]
+        if len(children) == 0:
+            continue
+        parents, group_starts = np.unique(unit_parents[children], return_index=True)
+        count_cube[parents, start_day:, :] = np.add.reduceat(count_cube[children, start_day:, :], group_starts, axis=0)
+        present[parents, start_day:] = np.logical_or.reduceat(present[children, start_day:], group_starts, axis=0)
 
-    series_data = np.vstack([susceptible, infected, dead]).T
 
-    if 'sip_date' in map_state_to_series:
-        sip_date = map_state_to_series[state]['sip_date']
+def _build_count_index(map_leaf_to_fips, unique_dates, opt_county_level):
+    '''
+    Unit hierarchy and dates of a count cube, before any counts are filled in
+    :param map_leaf_to_fips: dictionary of (state, leaf unit name) to FIPS code (or NaN)
+    :param unique_dates: sorted numpy array of dates
+    :param opt_county_level: whether the leaves are counties
+    :return: index dictionary, with an all-False present mask
+    '''
+    # sort leaves by (state, name) so each state's counties are contiguous
+    sorted_leaves = sorted(map_leaf_to_fips.keys())
+    leaf_names = [leaf for _, leaf in sorted_leaves]
+    leaf_fips = [None if pd.isnull(map_leaf_to_fips[x]) else int(map_leaf_to_fips[x]) for x in sorted_leaves]
+    state_names = sorted(set(state for state, _ in sorted_leaves))
+
+    n_leaves = len(leaf_names)
+    if opt_county_level:
+        n_units = n_leaves + len(state_names) + 1
+        map_state_to_ind = {state: n_leaves + ind for ind, state in enumerate(state_names)}
+        map_state_to_fips = dict()
+        for (state, _), fips in zip(sorted_leaves, leaf_fips):
+            if fips is not None:
+                map_state_to_fips[state] = min(fips // 1000, map_state_to_fips.get(state, fips // 1000))
+        unit_names = leaf_names + state_names + ['total']
+        unit_fips = leaf_fips + [map_state_to_fips.get(state) for state in state_names] + [None]
+        unit_levels = ['county'] * n_leaves + ['state'] * len(state_names) + ['total']
+        unit_parents = np.array([map_state_to_ind[state] for state, _ in sorted_leaves] +
+                                [n_units - 1] * len(state_names) + [-1], dtype=int)
+    else:
+        n_units = n_leaves + 1
+        unit_names = leaf_names + ['total']
+        unit_fips = leaf_fips + [None]
+        unit_levels = ['state'] * n_leaves + ['total']
+        unit_parents = np.array([n_units - 1] * n_leaves + [-1], dtype=int)
+
+    return {'unit_names': unit_names,
+            'unit_fips': unit_fips,
+            'unit_levels': unit_levels,
+            'unit_parents': unit_parents,
+            'dates': np.asarray(unique_dates, dtype='datetime64[ns]'),
+            'present': np.zeros((n_units, len(unique_dates)), dtype=bool)}
+
+
+def _fold_chunk_into_count_cube(count_cube, index, count_data, map_leaf_to_ind):
+    '''
+    In-place write of a chunk of (validated) rows into their (unit, day) cells; later rows win, as in the CSV
+    :return: numpy array of the day indices written
+    '''
+    leaf_units, _ = _get_leaf_units(count_data)
+    unit_codes = map_leaf_to_ind.get_indexer(leaf_units)
+    day_codes = np.searchsorted(index['dates'], count_data['date'].values.astype('datetime64[ns]'))
+    count_cube[unit_codes, day_codes, CUBE_CASES] = count_data['cases'].values
+    count_cube[unit_codes, day_codes, CUBE_DEATHS] = count_data['deaths'].values
+    index['present'][unit_codes, day_codes] = True
+    return day_codes
+
+
+def build_count_cube(count_data):
+    '''
+    Fold cumulative counts by (unit, date) into a dense (unit, day, {cases, deaths}) array
+      Units are the sorted leaf units (states, or counties grouped by state for county-level data), then for county-level
+      data the sorted states, then the 'total' pseudo-state. Days a leaf unit doesn't report are forward-filled (and zero
+      before its first report) and flagged False in the 'present' mask; states and the total are sums of their children.
+    :param count_data: dataframe with date, state, fips, cases, deaths columns (and county for county-level data), or a
+      function returning a fresh iterable of such dataframes (see read_count_chunks), which is read through twice
+    :return: tuple of count cube as numpy array, and index dictionary
+    '''
+    if isinstance(count_data, pd.DataFrame):
+        validated_count_data = validate_count_chunk(count_data)
+        get_chunks = lambda: [validated_count_data]
     else:
-        sip_date = None
+        get_chunks = count_data
+
+    # first pass: just the units and dates, so the cube can be allocated once
+    map_leaf_to_fips = dict()
+    unique_dates = np.array([], dtype='datetime64[ns]')
+    opt_county_level = False
+    for chunk in get_chunks():
+        leaf_units, opt_county_level = _get_leaf_units(chunk)
+        leaf_table = pd.DataFrame({'state': chunk['state'].astype(str).values, 'leaf': leaf_units,
+                                   'fips': chunk['fips'].values})
+        for key, fips in leaf_table.groupby(['state', 'leaf'], sort=False)['fips'].last().items():
+            if key not in map_leaf_to_fips or not pd.isnull(fips):
+                map_leaf_to_fips[key] = fips
+        unique_dates = np.union1d(unique_dates, chunk['date'].values.astype('datetime64[ns]'))
+
+    index = _build_count_index(map_leaf_to_fips, unique_dates, opt_county_level)
+    n_leaves = len(map_leaf_to_fips)
+    map_leaf_to_ind = pd.Index(index['unit_names'][:n_leaves])
+
+    # second pass: fold each chunk straight into the cube
+    count_cube = np.zeros((len(index['unit_names']), len(unique_dates), 2), dtype=np.int64)
+    for chunk in get_chunks():
+        _fold_chunk_into_count_cube(count_cube, index, chunk, map_leaf_to_ind)
+
+    # NB: leaves come first, so these slices are views and the fill happens in place
+    _forward_fill(count_cube[:n_leaves], index['present'][:n_leaves])
+    _aggregate_units(count_cube, index['present'], index)
+    _update_reporting_days(index)
+    return count_cube, index
+
+
+def _update_reporting_days(index):
+    present = index['present']
+    index['first_day'] = np.argmax(present, axis=1)
+    index['last_day'] = present.shape[1] - 1 - np.argmax(present[:, ::-1], axis=1)
+
+
+def append_to_count_cube(count_cube, index, new_count_data):
+    '''
+    Fold rows appended to the counts CSV into an existing count cube
+      Rows for dates already in the cube are treated as revisions of that (unit, date). Rows for new units, or for
+      new dates that fall before the end of the cube, can't be appended and return None (callers should rebuild).
+      The result is the same cube build_count_cube would produce from the old and new rows together.
+    :param count_cube: (unit, day, 2) array of cumulative counts
+    :param index: index dictionary that goes with count_cube
+    :param new_count_data: dataframe of the appended rows, same columns as the counts CSV
+    :return: tuple of new count cube, new index and first changed day, or None
+    '''
+    new_count_data = validate_count_chunk(new_count_data)
+    leaf_units, opt_county_level = _get_leaf_units(new_count_data)
+    leaf_level = 'county' if opt_county_level else 'state'
+    n_leaves = sum(level == leaf_level for level in index['unit_levels'])
+    map_leaf_to_ind = pd.Index(index['unit_names'][:n_leaves])
+    if index['unit_levels'][0] != leaf_level or (map_leaf_to_ind.get_indexer(leaf_units) < 0).any():
+        return None
+
+    old_dates = index['dates']
+    new_dates = np.asarray(new_count_data['date'].values, dtype='datetime64[ns]')
+    appended_dates = np.unique(new_dates[~np.isin(new_dates, old_dates)])
+    if len(appended_dates) > 0 and appended_dates[0] <= old_dates[-1]:
+        return None
+    all_dates = np.concatenate([old_dates, appended_dates])
+
+    n_units, n_old_days = count_cube.shape[:2]
+    n_days = len(all_dates)
+
+    new_count_cube = np.zeros((n_units, n_days, 2), dtype=np.int64)
+    new_count_cube[:, :n_old_days, :] = count_cube
+    present = np.zeros((n_units, n_days), dtype=bool)
+    present[:, :n_old_days] = index['present']
+    new_index = index.copy()
+    new_index.update({'dates': all_dates, 'present': present})
+
+    day_codes = _fold_chunk_into_count_cube(new_count_cube, new_index, new_count_data, map_leaf_to_ind)
+    first_changed_day = int(day_codes.min()) if len(day_codes) > 0 else n_days
+
+    _forward_fill(new_count_cube[:n_leaves], present[:n_leaves], start_day=first_changed_day)
+    _aggregate_units(new_count_cube, present, new_index, start_day=first_changed_day)
+    _update_reporting_days(new_index)
+    return new_count_cube, new_index, first_changed_day
+
+
+def _get_first_changed_day(old_cube_dict, count_cube, index):
+    '''
+    Compare a freshly built cube against the previously cached one
+    :return: first day index where any unit's counts differ (0 if the units or dates aren't comparable)
+    '''
+    old_index = old_cube_dict['index']
+    n_old_days = len(old_index['dates'])
+    if old_index['unit_names'] != index['unit_names'] or n_old_days > len(index['dates']) or \
+            not np.array_equal(old_index['dates'], index['dates'][:n_old_days]):
+        return 0
+    changed = (old_cube_dict['count_cube'] != count_cube[:, :n_old_days, :]).any(axis=2) | \
+              (old_index['present'] != index['present'][:, :n_old_days])
+    changed_days = np.nonzero(changed.any(axis=0))[0]
+    if len(changed_days) > 0:
+        revised_units = [index['unit_names'][i] for i in np.nonzero(changed.any(axis=1))[0]]
+        print(f'Revised counts on {len(changed_days)} days for: {", ".join(revised_units)}')
+        return int(changed_days[0])
+    return n_old_days
+
+
+def _get_cache_filenames(cache_filename_base):
+    return {'count_cube': cache_filename_base + '.npy',
+            'new_counts': cache_filename_base + '_new.npy',
+            'smoothed_new_counts': cache_filename_base + '_smoothed_new.npy',
+            'index': cache_filename_base + '_index.joblib'}
+
+
+def _open_cached_cube(cache_filename_base):
+    cache_filenames = _get_cache_filenames(cache_filename_base)
+    cube_dict = {key: np.load(filename, mmap_mode='r') for key, filename in cache_filenames.items() if
+                 key != 'index'}
+    cube_dict['index'] = joblib.load(cache_filenames['index'])
+    return cube_dict
+
+
+def _get_latest_cached_cube(cache_dir, counts_stem):
+    '''
+    Most recently written cube for this counts CSV (any content hash), or None
+    '''
+    if not os.path.exists(cache_dir):
+        return None
+    index_filenames = [os.path.join(cache_dir, x) for x in os.listdir(cache_dir) if
+                       x.startswith(counts_stem + '_') and x.endswith('_index.joblib')]
+    if len(index_filenames) == 0:
+        return None
+    latest_index_filename = max(index_filenames, key=os.path.getmtime)
+    try:
+        return _open_cached_cube(latest_index_filename[:-len('_index.joblib')])
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def _remove_older_cached_cubes(cache_dir, counts_stem, keep_filename_base):
+    '''
+    Delete the cubes cached for earlier versions of this counts CSV, so a daily update doesn't pile up a new set of
+      files every day. Only keep_filename_base is kept, since it's the one the next incremental append starts from.
+    '''
+    keep_filename = os.path.basename(keep_filename_base)
+    for filename in os.listdir(cache_dir):
+        if not filename.startswith(counts_stem + '_') or filename.startswith(keep_filename):
+            continue
+        # {counts_stem}_{16 hex digits of the content hash}..., anything else belongs to a different CSV
+        content_hash = filename[len(counts_stem) + 1:len(counts_stem) + 17]
+        if len(content_hash) < 16 or any(c not in '0123456789abcdef' for c in content_hash):
+            continue
+        try:
+            os.remove(os.path.join(cache_dir, filename))
+        except OSError:
+            print(f'Could not remove old cached cube {filename}, leaving it')
+
+
+def load_count_cube(counts_filename, cache_dir=count_cube_dir, opt_incremental=True, chunksize=2 ** 16):
+    '''
+    Open the count cube for a counts CSV, building and caching it first if this CSV content hasn't been seen
+      The cube is opened memory-mapped and read-only, so parallel workers share the same pages.
+      With opt_incremental, a new CSV that only appends rows to the last one we cached is folded in by parsing just
+      the appended bytes; otherwise the CSV is parsed in full but compared against the last cube so the derived
+      daily differences and smoothing are only recomputed from the first revised day onward.
+    :param counts_filename: path to the cumulative counts CSV
+    :param cache_dir: directory holding the cached cubes
+    :param opt_incremental: whether to reuse the most recent cached cube for a different version of the CSV
+    :param chunksize: rows per chunk when the CSV has to be read in full; bounds peak memory apart from the cube itself
+    :return: dictionary of count_cube, new_counts, smoothed_new_counts (numpy memmaps) and index
+    '''
+    counts_stem = f'{os.path.splitext(os.path.basename(counts_filename))[0]}_v{count_cube_version}'
+    old_cube_dict = _get_latest_cached_cube(cache_dir, counts_stem) if opt_incremental else None
+    old_source_size = None if old_cube_dict is None else old_cube_dict['index'].get('source_size')
+
+    source_hash, prefix_hash = get_file_hashes(counts_filename, prefix_size=old_source_size)
+    source_size = os.path.getsize(counts_filename)
+    cache_filename_base = os.path.join(cache_dir, f'{counts_stem}_{source_hash[:16]}')
+    cache_filenames = _get_cache_filenames(cache_filename_base)
+
+    if not all(os.path.exists(filename) for filename in cache_filenames.values()):
+        appended = None
+        if old_cube_dict is not None and prefix_hash is not None and \
+                prefix_hash == old_cube_dict['index'].get('source_hash'):
+            print(f'Appending new rows of {counts_filename} to the cached count cube...')
+            with open(counts_filename, 'rb') as f:
+                header = f.readline()
+                f.seek(old_source_size)
+                new_rows = f.read()
+            new_count_data = pd.read_csv(io.BytesIO(header + new_rows), dtype={'state': str, 'county': str})
+            appended = append_to_count_cube(old_cube_dict['count_cube'], old_cube_dict['index'], new_count_data)
+            print(f'...{len(new_count_data)} new rows')
+
+        if appended is not None:
+            count_cube, index, first_changed_day = appended
+        else:
+            print(f'Building count cube for {counts_filename}...')
+            count_cube, index = build_count_cube(lambda: read_count_chunks(counts_filename, chunksize=chunksize))
+            first_changed_day = 0 if old_cube_dict is None else _get_first_changed_day(old_cube_dict, count_cube,
+                                                                                       index)
+        index['source_hash'] = source_hash
+        index['source_size'] = source_size
+
+        n_days = count_cube.shape[1]
+        new_counts = np.zeros(count_cube.shape, dtype=np.int64)
+        smoothed_new_counts = np.zeros(count_cube.shape, dtype=np.float64)
+        if first_changed_day > 0:
+            n_old_days = old_cube_dict['count_cube'].shape[1]
+            new_counts[:, :n_old_days, :] = old_cube_dict['new_counts']
+            smoothed_new_counts[:, :n_old_days, :] = old_cube_dict['smoothed_new_counts']
+        if first_changed_day < n_days:
+            print(f'Recomputing daily differences from {str(index["dates"][first_changed_day])[:10]} on...')
+        _fill_derived_counts(count_cube, new_counts, smoothed_new_counts,
+                             start_day=min(first_changed_day, n_days))
+
+        if not os.path.exists(cache_dir):
+            os.mkdir(cache_dir)
+        # write to temporary files, then move into place, so a crash never leaves a half-written cube behind
+        #   NB: index goes last since its presence is what marks the cube as complete
+        for key, array in (('count_cube', count_cube),
+                           ('new_counts', new_counts),
+                           ('smoothed_new_counts', smoothed_new_counts)):
+            with open(cache_filenames[key] + '.tmp', 'wb') as f:
+                np.save(f, array)
+            os.replace(cache_filenames[key] + '.tmp', cache_filenames[key])
+        joblib.dump(index, cache_filenames['index'] + '.tmp')
+        os.replace(cache_filenames['index'] + '.tmp', cache_filenames['index'])
+        old_cube_dict = None  # let go of the old memmaps before deleting their files
+        _remove_older_cached_cubes(cache_dir, counts_stem, cache_filename_base)
+        print('...done!')
+
+    return _open_cached_cube(cache_filename_base)
+
+
+class DataStore:
+    '''
+    Lazy holder for the source data
+      Nothing is parsed at construction time. Each CSV is read the first time it is needed and each state's series
+      are materialized on first access and memoized, so importing this module (or running a single state) is cheap.
+      Point counts_filename at the NYT county-level CSV (us-counties.csv) to get counties ("County, State", or by FIPS)
+      as well as states and the total, all behind the same get_state_data interface.
+    '''
+
+    def __init__(self,
+                 data_dir=data_dir,
+                 counts_filename='counts.csv',
+                 population_filename='state_population.csv',
+                 sip_filename='shelter_in_place_dates_by_state.csv',
+                 county_population_filename='county_population.csv',
+                 cache_dir=count_cube_dir,
+                 opt_incremental_ingest=True):
+        self.data_dir = data_dir
+        self.counts_filename = counts_filename
+        self.population_filename = population_filename
+        self.county_population_filename = county_population_filename
+        self.sip_filename = sip_filename
+        self.cache_dir = cache_dir
+        self.opt_incremental_ingest = opt_incremental_ingest
+
+        self._full_count_data = None
+        self._cube_dict = None
+        self._map_unit_name_to_ind = None
+        self._map_fips_to_ind = None
+        self._map_state_to_series = dict()
+        self._map_smoothing_to_new_counts = dict()
+        self._map_config_to_preprocessed_data = dict()
+        self._map_state_to_population = None
+        self._map_state_to_sip_date = None
+
+    @property
+    def full_count_data(self):
+        '''
+        Cumulative counts by state and date, with the 'total' pseudo-state appended
+        :return: pandas dataframe sorted (stably) by date
+        '''
+        if self._full_count_data is None:
+            # NB: full_count_data is cumulative
+            # from https://github.com/nytimes/covid-19-data
+            # curl https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-states.csv
+            full_count_data = pd.read_csv(os.path.join(self.data_dir, self.counts_filename))
+            full_count_data['date'] = full_count_data['date'].astype('datetime64[ns]')
+
+            # get totals across U.S. with a single grouped pass over the rows
+            total_counts_data = full_count_data.groupby('date', as_index=False, sort=True)[['cases', 'deaths']].sum()
+            total_counts_data['state'] = 'total'
+            full_count_data = pd.concat([full_count_data, total_counts_data], ignore_index=True, sort=False)
+
+            # NB: a stable sort on date keeps the last row for any duplicated (state, date) pair, same as building a dict
+            self._full_count_data = full_count_data.sort_values('date', kind='mergesort', ignore_index=True)
+        return self._full_count_data
+
+    @property
+    def date_range(self):
+        return pd.date_range(self.count_index['dates'][0], self.count_index['dates'][-1])
+
+    def _load_count_cube(self):
+        self._cube_dict = load_count_cube(os.path.join(self.data_dir, self.counts_filename),
+                                          cache_dir=self.cache_dir,
+                                          opt_incremental=self.opt_incremental_ingest)
+        self._map_unit_name_to_ind = {name: ind for ind, name in enumerate(self.count_index['unit_names'])}
+        self._map_fips_to_ind = {fips: ind for ind, fips in enumerate(self.count_index['unit_fips']) if
+                                 fips is not None}
+
+    @property
+    def cube_dict(self):
+        if self._cube_dict is None:
+            self._load_count_cube()
+        return self._cube_dict
+
+    @property
+    def count_cube(self):
+        '''
+        Dense, memory-mapped (unit, day, {cases, deaths}) array of cumulative counts
+        :return: numpy memmap
+        '''
+        return self.cube_dict['count_cube']
+
+    @property
+    def count_index(self):
+        return self.cube_dict['index']
+
+    def get_unit_ind(self, state):
+        '''
+        Row of the count cube for a state, looked up by name or FIPS code
+        :param state: state name as string or FIPS code as int
+        :return: int
+        '''
+        if self._map_unit_name_to_ind is None:
+            self._load_count_cube()
+        if state in self._map_unit_name_to_ind:
+            return self._map_unit_name_to_ind[state]
+        return self._map_fips_to_ind[state]
+
+    def get_unit_name(self, state):
+        '''
+        Canonical name of a unit given its name or FIPS code
+        :return: string
+        '''
+        return self.count_index['unit_names'][self.get_unit_ind(state)]
+
+    @property
+    def state_names(self):
+        return sorted(self.count_index['unit_names'])
+
+    def get_unit_names(self, level=None):
+        '''
+        Names of the units in the count cube, in cube order
+        :param level: 'county', 'state', 'total', or None for every level
+        :return: list of strings
+        '''
+        return [name for name, unit_level in zip(self.count_index['unit_names'], self.count_index['unit_levels']) if
+                level is None or unit_level == level]
+
+    def get_parent(self, state):
+        '''
+        Next unit up the hierarchy (a county's state, a state's 'total')
+        :param state: unit name as string or FIPS code as int
+        :return: unit name as string, or None for the total
+        '''
+        parent_ind = self.count_index['unit_parents'][self.get_unit_ind(state)]
+        return None if parent_ind < 0 else self.count_index['unit_names'][parent_ind]
+
+    @property
+    def map_state_to_population(self):
+        '''
+        Population by unit. Counties are only included if their FIPS code shows up in county_population_filename
+          (a CSV with fips and population columns), since the NYT counts don't carry populations.
+        '''
+        if self._map_state_to_population is None:
+            # get state populations from https://www.census.gov/data/datasets/time-series/demo/popest/2010s-state-detail.html
+            state_populations = pd.read_csv(os.path.join(self.data_dir, self.population_filename), thousands=',')
+            map_state_to_population = {state: int(population) for state, population in
+                                       zip(state_populations['state'], state_populations['population'])}
+            map_state_to_population['total'] = sum(map_state_to_population.values())
+
+            county_population_filename = os.path.join(self.data_dir, self.county_population_filename)
+            if 'county' in self.count_index['unit_levels'] and os.path.exists(county_population_filename):
+                # get county populations from https://www.census.gov/data/datasets/time-series/demo/popest/2010s-counties-total.html
+                county_populations = pd.read_csv(county_population_filename, thousands=',')
+                map_fips_to_population = dict(zip(county_populations['fips'].astype(int),
+                                                   county_populations['population'].astype(int)))
+                for county in self.get_unit_names(level='county'):
+                    fips = self.count_index['unit_fips'][self.get_unit_ind(county)]
+                    if fips in map_fips_to_population:
+                        map_state_to_population[county] = int(map_fips_to_population[fips])
+            self._map_state_to_population = map_state_to_population
+        return self._map_state_to_population
+
+    def get_units_without_population(self, level=None):
+        '''
+        Units that get_unit_data can't serve because map_state_to_population has nothing for them
+        :param level: 'county', 'state', 'total', or None for every level
+        :return: list of strings
+        '''
+        return [name for name in self.get_unit_names(level=level) if name not in self.map_state_to_population]
+
+    @property
+    def map_state_to_sip_date(self):
+        if self._map_state_to_sip_date is None:
+            # get shelter-in-place dates
+            # from https://www.finra.org/rules-guidance/key-topics/covid-19/shelter-in-place
+            SIP_dates = pd.read_csv(os.path.join(self.data_dir, self.sip_filename))
+            SIP_dates['sip_date'] = SIP_dates['sip_date'].astype('datetime64[ns]')
+            map_state_to_sip_date = dict(zip(SIP_dates['state'], SIP_dates['sip_date']))
+            map_state_to_sip_date['total'] = datetime.datetime.strptime('2020-03-20', '%Y-%m-%d')
+
+            # counties follow their state's order
+            for county in self.get_unit_names(level='county'):
+                parent = self.get_parent(county)
+                if parent in map_state_to_sip_date:
+                    map_state_to_sip_date[county] = map_state_to_sip_date[parent]
+            self._map_state_to_sip_date = map_state_to_sip_date
+        return self._map_state_to_sip_date
+
+    def get_day_slice(self, unit_ind):
+        '''
+        Days of the cube a unit reported on
+          Reporting days are almost always contiguous, in which case this is a slice and reads are zero-copy views.
+        :param unit_ind: row of the count cube
+        :return: slice, or boolean mask if the unit skipped days
+        '''
+        first_day = self.count_index['first_day'][unit_ind]
+        last_day = self.count_index['last_day'][unit_ind]
+        present = self.count_index['present'][unit_ind]
+        if present[first_day:last_day + 1].all():
+            return slice(first_day, last_day + 1)
+        return present
+
+    def get_state_series(self, state):
+        '''
+        Materialize (once) the cases/deaths series and daily differences for a state
+        :param state: state (or county) name as string, or FIPS code as int
+        :return: dict with cases_series, deaths_series, cases_diff, deaths_diff and, if known, sip_date
+        '''
+        state = self.get_unit_name(state)
+        if state not in self._map_state_to_series:
+            unit_ind = self.get_unit_ind(state)
+            day_slice = self.get_day_slice(unit_ind)
+            unit_counts = self.count_cube[unit_ind, day_slice, :]
+            date_index = pd.DatetimeIndex(self.count_index['dates'][day_slice])
+
+            cases_series = pd.Series(unit_counts[:, CUBE_CASES], index=date_index, copy=False)
+            deaths_series = pd.Series(unit_counts[:, CUBE_DEATHS], index=date_index, copy=False)
+
+            state_series = {'cases_series': cases_series,
+                            'deaths_series': deaths_series,
+                            'cases_diff': cases_series.diff(),
+                            'deaths_diff': deaths_series.diff()}
+            if state in self.map_state_to_sip_date:
+                state_series['sip_date'] = self.map_state_to_sip_date[state]
+
+            self._map_state_to_series[state] = state_series
+        return self._map_state_to_series[state]
+
+    @property
+    def map_state_to_series(self):
+        '''
+        Materializes every state, only here for callers that want the whole dictionary
+        :return: dict of state name to the output of get_state_series
+        '''
+        return {state: self.get_state_series(state) for state in self.state_names}
+
+    def get_smoothed_new_counts(self, smoothing_type=SmoothingType.CENTERED_3_DAY, **smoothing_kwargs):
+        '''
+        Daily counts for every unit, smoothed all at once and cached per configuration
+          No smoothing and the default centered three-day smoothing come straight from the cached (and incrementally
+          updated) cube files; anything else is computed from the daily counts on first request.
+        :param smoothing_type: SmoothingType, or a function from a (unit, day, 2) array to one of the same shape
+        :param smoothing_kwargs: passed on to the smoothing function, e.g. window or alpha
+        :return: (unit, day, 2) array
+        '''
+        if smoothing_type == SmoothingType.NONE:
+            return self.cube_dict['new_counts']
+        if smoothing_type == SmoothingType.CENTERED_3_DAY and len(smoothing_kwargs) == 0:
+            return self.cube_dict['smoothed_new_counts']
+        config = (smoothing_type, tuple(sorted(smoothing_kwargs.items())))
+        if config not in self._map_smoothing_to_new_counts:
+            smoothing_function = smoothing_kernels.get(smoothing_type, smoothing_type)
+            self._map_smoothing_to_new_counts[config] = smoothing_function(self.cube_dict['new_counts'],
+                                                                           **smoothing_kwargs)
+        return self._map_smoothing_to_new_counts[config]
+
+    def get_preprocessed_data(self,
+                              smoothing_type=SmoothingType.CENTERED_3_DAY,
+                              max_date=None,
+                              threshold_count=20,
+                              threshold_fraction=0.1,
+                              **smoothing_kwargs):
+        '''
+        Smoothed daily counts, their cumulative sums and the days each unit crossed its fitting threshold, for every
+          unit at once and cached per configuration
+          A unit's threshold is min(threshold_count, threshold_fraction * its cumulative count as of max_date), and
+          its threshold day is the first day it reached that (or its last day, if it never did).
+        :param smoothing_type: see get_smoothed_new_counts
+        :param max_date: datetime; days on or after it are ignored for the thresholds (None for all days)
+        :param threshold_count: threshold cap, in cumulative counts
+        :param threshold_fraction: threshold as a fraction of the cumulative count as of max_date
+        :param smoothing_kwargs: passed on to the smoothing function
+        :return: dictionary of new_counts, cum_counts as (unit, day, 2) arrays, thresholds as (unit, 2) array and
+          day_of_threshold_met as (unit, 2) int array of days since each unit's first report
+        '''
+        dates = self.count_index['dates']
+        max_day = len(dates) if max_date is None else int(np.searchsorted(dates, np.datetime64(max_date, 'ns')))
+        config = (smoothing_type, tuple(sorted(smoothing_kwargs.items())), max_day, threshold_count,
+                  threshold_fraction)
+        if config not in self._map_config_to_preprocessed_data:
+            new_counts = self.get_smoothed_new_counts(smoothing_type, **smoothing_kwargs)
+
+            # cumulative sums only start at each unit's first report (smoothing can spill onto the day before)
+            in_series = self.count_index['present']
+            cum_counts = np.cumsum(np.where(in_series[:, :, np.newaxis], new_counts, 0), axis=1)
+
+            in_window = in_series[:, :max_day]
+            thresholds = np.minimum(threshold_count, cum_counts[:, max_day - 1, :] * threshold_fraction)
+            threshold_met = in_window[:, :, np.newaxis] & (cum_counts[:, :max_day, :] >= thresholds[:, np.newaxis, :])
+            series_day = np.cumsum(in_window, axis=1) - 1
+            day_of_threshold_met = np.where(threshold_met.any(axis=1),
+                                            np.take_along_axis(series_day, np.argmax(threshold_met, axis=1), axis=1),
+                                            in_window.sum(axis=1)[:, np.newaxis] - 1)
+
+            self._map_config_to_preprocessed_data[config] = {'new_counts': new_counts,
+                                                             'cum_counts': cum_counts,
+                                                             'thresholds': thresholds,
+                                                             'day_of_threshold_met': day_of_threshold_met}
+        return self._map_config_to_preprocessed_data[config]
+
+    def get_unit_data(self,
+                      state,
+                      smoothing_type=SmoothingType.CENTERED_3_DAY,
+                      max_date=None,
+                      **kwargs):
+        '''
+        One unit's slice of get_preprocessed_data, plus its population, shelter-in-place date and first date
+        :param state: unit name as string or FIPS code as int
+        :param kwargs: passed on to get_preprocessed_data
+        :return: dictionary of series_data ([susceptible, infected, dead] by day), new_counts, cum_counts,
+          thresholds, day_of_threshold_met, population, sip_date, min_date
+        '''
+        state = self.get_unit_name(state)
+        unit_ind = self.get_unit_ind(state)
+        day_slice = self.get_day_slice(unit_ind)
+        preprocessed_data = self.get_preprocessed_data(smoothing_type=smoothing_type, max_date=max_date, **kwargs)
+        if state not in self.map_state_to_population:
+            raise ValueError(f'No population for {state}: county populations are read by FIPS code from '
+                             f'{os.path.join(self.data_dir, self.county_population_filename)} (fips and population columns)')
+        population = self.map_state_to_population[state]
+
+        # format count_data into I and S values for SIR Model
+        cum_counts = preprocessed_data['cum_counts'][unit_ind, day_slice, :]
+        series_data = np.column_stack([population - self.count_cube[unit_ind, day_slice, CUBE_CASES],
+                                       cum_counts[:, CUBE_CASES],
+                                       cum_counts[:, CUBE_DEATHS]])
+
+        return {'series_data': series_data,
+                'new_counts': preprocessed_data['new_counts'][unit_ind, day_slice, :],
+                'cum_counts': cum_counts,
+                'thresholds': preprocessed_data['thresholds'][unit_ind],
+                'day_of_threshold_met': preprocessed_data['day_of_threshold_met'][unit_ind],
+                'population': population,
+                'sip_date': self.map_state_to_sip_date.get(state),
+                'min_date': pd.Timestamp(self.count_index['dates'][day_slice][0])}
+
+    def get_state_data(self,
+                       state,
+                       opt_smoothing=False,
+                       smoothing_type=None):
+        # tmp = datetime.datetime.strptime('2020-01-21', '%Y-%m-%d')
+        # tmp2 = datetime.datetime.strptime('2020-03-19', '%Y-%m-%d')
+        # tmp2 - tmp = 58 days
+        # NP: Cali shelter-in-place (SIP) March 19 Data starts at Jan. 21.
+
+        if smoothing_type is None:
+            smoothing_type = SmoothingType.CENTERED_3_DAY if opt_smoothing else SmoothingType.NONE
+        unit_data = self.get_unit_data(state, smoothing_type=smoothing_type)
+        return {key: unit_data[key] for key in ('series_data', 'population', 'sip_date', 'min_date')}
+
+
+# only want to load this once, so share one lazy store as a singleton
+data_store = DataStore()
+
+
+def get_state_data(state,
+                   opt_smoothing=False,
+                   smoothing_type=None):
+    return data_store.get_state_data(state, opt_smoothing=opt_smoothing, smoothing_type=smoothing_type)
+
+
+def get_unit_data(state,
+                  smoothing_type=SmoothingType.CENTERED_3_DAY,
+                  max_date=None,
+                  **kwargs):
+    return data_store.get_unit_data(state, smoothing_type=smoothing_type, max_date=max_date, **kwargs)
+
 
-    return {'series_data': series_data,
-            'population': population,
-            'sip_date': sip_date,
-            'min_date': min_date}
+def __getattr__(name):
+    '''
+    Forward the old module-level attributes (map_state_to_population, map_state_to_series, etc.) to the shared
+      DataStore, so they are only computed when somebody actually asks for them
+    '''
+    if name in ('full_count_data', 'date_range', 'map_state_to_series', 'map_state_to_population',
+                'map_state_to_sip_date', 'state_names', 'count_cube', 'count_index', 'cube_dict'):
+        return getattr(data_store, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -181,44 +181,31 @@ def generate_state_prediction(map_state_name_to_model,
                 param_inds_to_plot = list(range(len(params)))
                 param_inds_to_plot = np.random.choice(param_inds_to_plot, min(n_samples, len(param_inds_to_plot)),
                                                       replace=False)
-                sols_to_plot = [state_model.run_simulation(in_params=params[param_ind]) for param_ind in
-                                tqdm(param_inds_to_plot)]
-
                 start_ind_sol = len(state_model.data_new_tested) + state_model.burn_in
                 start_ind_data = start_ind_sol - 1 - state_model.burn_in
+
+                # only the prediction window goes into the report, so that's all we simulate
+                prediction_indices = np.arange(start_ind_sol, len(state_model.t_vals))
+                sols_to_plot = state_model.run_simulation_batch([params[param_ind] for param_ind in param_inds_to_plot],
+                                                                sol_indices=prediction_indices)
                 sol_date_range = [
                     state_model.min_date - datetime.timedelta(days=state_model.burn_in) + datetime.timedelta(
-                        days=1) * i for i in range(len(sols_to_plot[0][0]))]
-
-                sols_to_plot_new_tested = list()
-                sols_to_plot_new_dead = list()
-                sols_to_plot_tested = list()
-                sols_to_plot_dead = list()
-                for sol in sols_to_plot:
-                    tested = sol[1]
-                    tested_range = np.cumsum(tested[start_ind_sol:])
-
-                    dead = sol[2]
-                    dead_range = np.cumsum(dead[start_ind_sol:])
+                        days=1) * i for i in prediction_indices]
 
-                    sols_to_plot_new_tested.append(tested)
-                    sols_to_plot_new_dead.append(dead)
+                data_tested_at_start = np.cumsum(state_model.data_new_tested)[start_ind_data]
+                data_dead_at_start = np.cumsum(state_model.data_new_dead)[start_ind_data]
 
-                    data_tested_at_start = np.cumsum(state_model.data_new_tested)[start_ind_data]
-                    data_dead_at_start = np.cumsum(state_model.data_new_dead)[start_ind_data]
-
-                    tested = [0] * start_ind_sol + [data_tested_at_start + tested_val for tested_val in tested_range]
-                    dead = [0] * start_ind_sol + [data_dead_at_start + dead_val for dead_val in dead_range]
-
-                    sols_to_plot_tested.append(tested)
-                    sols_to_plot_dead.append(dead)
+                sols_to_plot_new_tested = sols_to_plot[:, 1, :]
+                sols_to_plot_new_dead = sols_to_plot[:, 2, :]
+                sols_to_plot_tested = data_tested_at_start + np.cumsum(sols_to_plot_new_tested, axis=1)
+                sols_to_plot_dead = data_dead_at_start + np.cumsum(sols_to_plot_new_dead, axis=1)
 
                 output_list_of_dicts = list()
-                for date_ind in range(start_ind_sol, len(sols_to_plot_tested[0])):
-                    distro_new_tested = [tested[date_ind] for tested in sols_to_plot_new_tested]
-                    distro_new_dead = [dead[date_ind] for dead in sols_to_plot_new_dead]
-                    distro_tested = [tested[date_ind] for tested in sols_to_plot_tested]
-                    distro_dead = [dead[date_ind] for dead in sols_to_plot_dead]
+                for date_ind in range(len(prediction_indices)):
+                    distro_new_tested = sols_to_plot_new_tested[:, date_ind]
+                    distro_new_dead = sols_to_plot_new_dead[:, date_ind]
+                    distro_tested = sols_to_plot_tested[:, date_ind]
+                    distro_dead = sols_to_plot_dead[:, date_ind]
                     tmp_dict = {'model_type': approx_type.value[1],
                                 'date': sol_date_range[date_ind],
                                 'total_positive_mean': np.average(distro_tested),
@@ -505,15 +492,25 @@ def run_everything(run_states,
                    logarithmic_params=list(),
                    plot_param_names=None,
                    opt_simplified=False,
+                   report_every_n_units=None,
                    **kwargs):
+    '''
+    Fit and report every unit in run_states
+    :param run_states: unit names (states, 'total', or "County, State" when load_data is a county-level DataStore)
+    :param load_data: anything with map_state_to_population and get_unit_data, i.e. the load_data module or a DataStore
+    :param report_every_n_units: how often to regenerate the report; defaults to every 10th unit when simplified and
+      every unit otherwise. Each report covers every model so far, so raise this for county runs.
+    '''
     # setting intermediate variables to global allows us to inspect these objects via monkey-patching
     global map_state_name_to_model, state_report
 
     map_state_name_to_model = dict()
+    if report_every_n_units is None:
+        report_every_n_units = 10 if opt_simplified else 1
 
     for state_ind, state in enumerate(run_states):
         print(
-            f'\n----\n----\nProcessing {state} ({state_ind} of {len(run_states)}, pop. {load_data.map_state_to_population[state]:,})...\n----\n----\n')
+            f'\n----\n----\nProcessing {state} ({state_ind} of {len(run_states)}, pop. {load_data.map_state_to_population.get(state, 0):,})...\n----\n----\n')
 
         if True:
             print('Building model with the following args...')
@@ -545,8 +542,8 @@ def run_everything(run_states,
             state_report_filename = path.join(plot_subfolder, f'simplified_state_report.joblib')
             state_prediction_filename = path.join(plot_subfolder, f'simplified_state_prediction.joblib')
             filename_format_str = path.join(plot_subfolder, f'simplified_boxplot_for_{{}}_{{}}.png')
-            if state_ind % 10 == 0 or state_ind == len(run_states) - 1:
-                print('Reporting every 10th state and at the end')
+            if state_ind % report_every_n_units == 0 or state_ind == len(run_states) - 1:
+                print(f'Reporting every {report_every_n_units} units and at the end')
                 state_report = generate_state_report(map_state_name_to_model,
                                                      state_report_filename=state_report_filename,
                                                      report_names=plot_param_names)
@@ -561,8 +558,8 @@ def run_everything(run_states,
         else:
             state_report_filename = path.join(plot_subfolder, 'state_report.csv')
             filename_format_str = path.join(plot_subfolder, 'boxplot_for_{}_{}.png')
-            if state_ind % 1 == 0 or state_ind == len(run_states) - 1:
-                print('Reporting every state and at the end')
+            if state_ind % report_every_n_units == 0 or state_ind == len(run_states) - 1:
+                print(f'Reporting every {report_every_n_units} units and at the end')
                 state_report = generate_state_report(map_state_name_to_model,
                                                      state_report_filename=state_report_filename)
                 for param_name in state_model.plot_param_names:
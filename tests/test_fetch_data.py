@@ -0,0 +1,153 @@
+import os
+import gzip
+import json
+import threading
+import http.server
+import pytest
+from sub_units import fetch_data
+
+CONTENT = b'date,state,fips,cases,deaths\n' + b''.join(
+    f'2020-03-{day:02d},Washington,53,{day * 10},{day}\n'.encode() for day in range(1, 29))
+ETAG = '"v1"'
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    '''
+    Just enough of a static file server for fetch_if_changed: ETag validation, Range with If-Range, and gzip
+    '''
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        opt_gzip = self.server.opt_gzip and 'gzip' in self.headers.get('Accept-Encoding', '')
+        body = self.server.gzipped_content if opt_gzip else self.server.content
+
+        if self.headers.get('If-None-Match') == self.server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        status = 200
+        range_header = self.headers.get('Range')
+        if range_header is not None and self.headers.get('If-Range') == self.server.etag:
+            start = int(range_header[len('bytes='):].split('-')[0])
+            body = body[start:]
+            status = 206
+
+        self.send_response(status)
+        self.send_header('ETag', self.server.etag)
+        self.send_header('Content-Length', str(len(body)))
+        if opt_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.HTTPServer(('127.0.0.1', 0), StandInHandler)
+    httpd.content = CONTENT
+    httpd.gzipped_content = gzip.compress(CONTENT)
+    httpd.etag = ETAG
+    httpd.opt_gzip = False
+    httpd.requests = list()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f'http://127.0.0.1:{httpd.server_address[1]}/us-states.csv'
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def read(filename):
+    with open(filename, 'rb') as f:
+        return f.read()
+
+
+def test_first_fetch(server, tmp_path):
+    filename = str(tmp_path / 'counts.csv')
+    assert fetch_data.fetch_if_changed(server.url, filename)
+    assert read(filename) == CONTENT
+    assert not os.path.exists(filename + '.part')
+    assert 'If-None-Match' not in server.requests[0]
+
+
+def test_not_modified(server, tmp_path):
+    filename = str(tmp_path / 'counts.csv')
+    fetch_data.fetch_if_changed(server.url, filename)
+    assert not fetch_data.fetch_if_changed(server.url, filename)
+    assert server.requests[-1]['If-None-Match'] == ETAG
+    assert read(filename) == CONTENT
+
+
+def test_new_version_upstream(server, tmp_path):
+    filename = str(tmp_path / 'counts.csv')
+    fetch_data.fetch_if_changed(server.url, filename)
+    server.content = CONTENT + b'2020-03-29,Washington,53,290,29\n'
+    server.etag = '"v2"'
+    assert fetch_data.fetch_if_changed(server.url, filename)
+    assert read(filename) == server.content
+
+
+@pytest.mark.parametrize('opt_gzip', [False, True])
+def test_resume(server, tmp_path, opt_gzip):
+    server.opt_gzip = opt_gzip
+    body = server.gzipped_content if opt_gzip else server.content
+    filename = str(tmp_path / 'counts.csv')
+
+    # leave things the way an interrupted download would
+    with open(filename + '.part', 'wb') as f:
+        f.write(body[:len(body) // 2])
+    with open(filename + '.fetch.json', 'w') as f:
+        json.dump({'partial': {'url': server.url,
+                               'etag': ETAG,
+                               'last_modified': None,
+                               'content_encoding': 'gzip' if opt_gzip else None}}, f)
+
+    assert fetch_data.fetch_if_changed(server.url, filename)
+    assert server.requests[-1]['Range'] == f'bytes={len(body) // 2}-'
+    assert server.requests[-1]['If-Range'] == ETAG
+    assert read(filename) == CONTENT
+    assert not os.path.exists(filename + '.part')
+
+
+def test_resume_after_upstream_changed(server, tmp_path):
+    filename = str(tmp_path / 'counts.csv')
+    with open(filename + '.part', 'wb') as f:
+        f.write(b'stale half of an older version')
+    with open(filename + '.fetch.json', 'w') as f:
+        json.dump({'partial': {'url': server.url, 'etag': '"v0"', 'last_modified': None,
+                               'content_encoding': None}}, f)
+
+    # If-Range doesn't match, so the server sends the whole thing and the stale part is thrown away
+    assert fetch_data.fetch_if_changed(server.url, filename)
+    assert read(filename) == CONTENT
+
+
+def test_gzip(server, tmp_path):
+    server.opt_gzip = True
+    filename = str(tmp_path / 'counts.csv')
+    assert fetch_data.fetch_if_changed(server.url, filename)
+    assert server.requests[0]['Accept-Encoding'] == 'gzip'
+    assert read(filename) == CONTENT
+
+
+def test_processed(server, tmp_path):
+    filename = str(tmp_path / 'counts.csv')
+    fetch_data.fetch_if_changed(server.url, filename)
+    assert not fetch_data.is_processed(filename)
+
+    # a run that crashed before mark_processed gets retried, even though upstream hasn't changed
+    assert not fetch_data.fetch_if_changed(server.url, filename)
+    assert not fetch_data.is_processed(filename)
+
+    fetch_data.mark_processed(filename)
+    assert not fetch_data.fetch_if_changed(server.url, filename)
+    assert fetch_data.is_processed(filename)
+
+    server.content = CONTENT + b'2020-03-29,Washington,53,290,29\n'
+    server.etag = '"v2"'
+    fetch_data.fetch_if_changed(server.url, filename)
+    assert not fetch_data.is_processed(filename)